@@ -0,0 +1,32 @@
+"""
+Configuration of the benchmarks, run them with `pytest benchmarks` (requires pytest-benchmark) or `tox -e bench`.
+`tox -e bench` compares a run with the last results saved in benchmarks/results and saves it (--benchmark-compare
+--benchmark-autosave); fail on regressions with `tox -e bench -- --benchmark-compare-fail=mean:25%`.
+The timings depend on the machine, so benchmarks/results is not under version control: make a baseline on the
+machine (or in the CI job) by running `tox -e bench` on the reference commit before the change to measure.
+"""
+import sys
+import os
+import pytest
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+from hydroponics import predefined_solutions, make_solution
+
+RECIPES = ["Tomato", "Eggplant", "Cucumber"]
+VOLUME = 10
+GROWTH_TIME = 60
+# No salt with a known solubility brings NH4+ or Mo, and the symbolic make_solution only solves the recipes without K+
+UNSOLVABLE_IONS = ["NH4+", "Mo"]
+UNSOLVABLE_IONS_SYMPY = UNSOLVABLE_IONS + ["K+"]
+
+@pytest.fixture(scope="session", params=RECIPES)
+def recipe(request) -> dict:
+    """
+    The predefined solution of a plant, as ions [g/L], as the salts [g/L] making it, and a plant taking up
+    80% of each ion during the growth time.
+    """
+    ions = predefined_solutions(request.param)
+    solvable = {ion: value for ion, value in ions.items() if ion not in UNSOLVABLE_IONS}
+    salts = {salt: mass/VOLUME for salt, mass in make_solution(solvable, [], VOLUME, backend="numeric").items()}
+    return {"name": request.param, "ions": ions, "solvable": solvable, "salts": salts,
+            "solvable_sympy": {ion: value for ion, value in ions.items() if ion not in UNSOLVABLE_IONS_SYMPY},
+            "plant": {ion: 0.8*value*VOLUME for ion, value in solvable.items()}}
@@ -0,0 +1,54 @@
+"""Benchmarks of the chemistry hot paths on the predefined Tomato, Eggplant and Cucumber solutions (see conftest.py)."""
+import numpy as np
+import pytest
+from conftest import VOLUME, GROWTH_TIME
+from hydroponics import (get_molar_mass, get_Ksp, salt2ions, salt2ions_batch, check_solubility, make_solution,
+                         pH_approximation, data4graph, generate_report)
+
+#-------------------------- Molar masses and solubility constants --------------------------
+def test_get_molar_mass(benchmark, recipe):
+    formulas = list(recipe["ions"]) + list(recipe["salts"])
+    benchmark(lambda: [get_molar_mass(formula) for formula in formulas])
+
+def test_get_molar_mass_cold(benchmark, recipe):
+    formulas = list(recipe["ions"]) + list(recipe["salts"])
+    benchmark.pedantic(lambda: [get_molar_mass(formula) for formula in formulas],
+                       setup=get_molar_mass.cache_clear, rounds=100)
+
+def test_get_Ksp(benchmark, recipe):
+    benchmark(lambda: [get_Ksp(salt) for salt in recipe["salts"]])
+
+def test_salt2ions(benchmark, recipe):
+    benchmark(salt2ions, recipe["salts"], VOLUME)
+
+def test_salt2ions_batch(benchmark, recipe):
+    # 100 000 random variations of the recipe
+    salts = list(recipe["salts"])
+    recipes = np.random.default_rng(0).uniform(0.5, 1.5, (100_000, len(salts))) * list(recipe["salts"].values())
+    benchmark(salt2ions_batch, recipes, VOLUME, salts=salts)
+
+#-------------------------- Solubility and preparation of the solution --------------------------
+def test_check_solubility(benchmark, recipe):
+    benchmark(check_solubility, recipe["salts"])
+
+def test_make_solution_numeric(benchmark, recipe):
+    benchmark(make_solution, recipe["solvable"], [], VOLUME, backend="numeric")
+
+def test_make_solution_sympy(benchmark, recipe):
+    benchmark.pedantic(make_solution, args=(recipe["solvable_sympy"], [], VOLUME), rounds=5)
+
+#-------------------------- pH and growth simulation --------------------------
+def test_pH_approximation(benchmark, recipe):
+    benchmark(pH_approximation, recipe["ions"], 25)
+
+def test_data4graph(benchmark, recipe):
+    benchmark(data4graph, recipe["solvable"], VOLUME, recipe["plant"], GROWTH_TIME)
+
+#-------------------------- Report --------------------------
+@pytest.mark.parametrize("dpi", [100, 500])
+def test_generate_report(benchmark, recipe, dpi):
+    ions_of_interest = list(recipe["solvable_sympy"])[:4]
+    plant = {ion: need for ion, need in recipe["plant"].items() if ion in recipe["solvable_sympy"]}
+    benchmark.pedantic(generate_report, args=("Eggplant", plant, GROWTH_TIME, ions_of_interest,
+                                              recipe["solvable_sympy"], VOLUME),
+                       kwargs={"output_path": None, "dpi": dpi}, rounds=3)
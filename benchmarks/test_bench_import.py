@@ -0,0 +1,21 @@
+"""Benchmarks of the cold start of the hydroponics package, each round runs in a fresh interpreter."""
+import sys
+import os
+import subprocess
+import pytest
+
+src_dir = os.path.dirname(os.path.realpath(__file__)) + "/../src"
+
+def cold_import(code: str) -> None:
+    env = dict(os.environ, PYTHONPATH=src_dir)
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+
+@pytest.mark.parametrize("code", [
+    "import hydroponics",
+    "import hydroponics; hydroponics.get_molar_mass('Ca(NO3)2')",
+    "import hydroponics; hydroponics.check_solubility({'KNO3': 0.5})",
+    # everything the package imported before the imports were lazy
+    "import hydroponics.Generate_Report, hydroponics.Refill_0",
+])
+def test_cold_import(benchmark, code):
+    benchmark.pedantic(cold_import, args=(code,), rounds=5, iterations=1)
@@ -12,8 +12,10 @@ In particular, the file contains functions to:
 import re
 import os
 import csv
-import pandas as pd
-from sympy import symbols, Eq, solve, solveset, S, Interval 
+from functools import lru_cache
+import numpy as np
+from .Instrumentation import instrumented, register_cache
+from .Ion_Registry import ion_id, ion_name, ion_formula
 
 
 # ----- Import User Data from Excel file -------------
@@ -22,9 +24,52 @@ def load_from_data(file_name):
     # Get the directory of the current file
     current_dir = os.path.dirname(os.path.realpath(__file__))
     # Construct the absolute path to the CSV file
-    final_path = current_dir+'\data\\'+ file_name
+    final_path = os.path.join(current_dir, 'data', file_name)
     return final_path
 
+#Parsed workbooks {path: (modification time, {sheet name: raw DataFrame})}, see read_user_workbook()
+_WORKBOOKS = {}
+
+def read_user_workbook(file_name: str = "UserData.xlsx", sidecar_dir: str = None) -> dict:
+    """
+    Parses every sheet of an Excel file of the data folder once and keeps them in memory.
+    The workbook is parsed again when its modification time changes.
+
+    Args:
+        file_name (str, optional): Name of the Excel file in the data folder. Defaults to "UserData.xlsx".
+        sidecar_dir (str, optional): Folder where a converted copy of the parsed sheets (pickle) is kept,
+            so that a new process can skip the Excel parsing. Defaults to None (no copy).
+
+    Returns:
+        dict: dictionary with keys as sheet names and values as DataFrames of the raw cells (no header).
+    """
+    import pandas as pd
+    path = load_from_data(file_name)
+    modification_time = os.path.getmtime(path)
+    if path in _WORKBOOKS and _WORKBOOKS[path][0] == modification_time:
+        return _WORKBOOKS[path][1]
+    
+    sidecar = os.path.join(sidecar_dir, os.path.basename(path) + ".pkl") if sidecar_dir else None
+    if sidecar and os.path.exists(sidecar) and os.path.getmtime(sidecar) >= modification_time:
+        sheets = pd.read_pickle(sidecar)
+    else:
+        sheets = pd.read_excel(path, sheet_name=None, header=None)
+        if sidecar:
+            os.makedirs(sidecar_dir, exist_ok=True)
+            pd.to_pickle(sheets, sidecar)
+    _WORKBOOKS[path] = (modification_time, sheets)
+    return sheets
+
+def _read_sheet(sheet_name: str, skiprows: int, file_name: str = "UserData.xlsx"):
+    """
+    Returns a sheet of the cached workbook as pd.read_excel(file_name, sheet_name, skiprows) would.
+    """
+    raw = read_user_workbook(file_name)[sheet_name]
+    header = ["Unnamed: " + str(j) if isinstance(name, float) else name for j, name in enumerate(raw.iloc[skiprows])]
+    df = raw.iloc[skiprows+1:].reset_index(drop=True)
+    df.columns = header
+    return df.infer_objects()
+
 def import_solution_data(solution_name: str) -> dict:
     """
     Import user data from the Excel file "UserData.xlsx" and returns it as a dictionary.
@@ -35,9 +80,8 @@ def import_solution_data(solution_name: str) -> dict:
     Returns:
         dict: Dictionary containing the concentration of the ions [g/L] in the solution.
     """
-    # Read the Excel file
-    file_name = load_from_data("UserData.xlsx")
-    df = pd.read_excel(file_name, sheet_name="My solution", skiprows=1)
+    # Read the Excel file (parsed once, see read_user_workbook)
+    df = _read_sheet("My solution", skiprows=1)
     # Create a dictionary using zip and dictionary comprehension
     try:
         ion_solution_dict = dict(zip(df['Ions'], df[solution_name]))
@@ -62,9 +106,8 @@ def predefined_solutions(plant:str, concentration:str="g" ) -> dict:
     if plant not in available_plants:
         raise ValueError(f"Plant {plant} not found. Available plants are {available_plants}.")
     else:
-        # Read the Excel file
-        file_name = load_from_data("UserData.xlsx")
-        df = pd.read_excel(file_name, sheet_name="Optimal Solution", skiprows=0)
+        # Read the Excel file (parsed once, see read_user_workbook)
+        df = _read_sheet("Optimal Solution", skiprows=0)
         # Create a dictionary using zip and dictionary comprehension
         ion_solution_dict = dict(zip(df['Formula'], df[str('c ['+concentration+'/L] '+plant)]))
         return ion_solution_dict
@@ -79,9 +122,8 @@ def import_plant_data(plant_name:str) -> dict:
     Returns:
         dict: dictionary containing the needs of the plant for each ion [g] for a full growth cycle
     """
-    # Read the Excel file
-    file_name = load_from_data("UserData.xlsx")
-    df = pd.read_excel(file_name, sheet_name="My plant", skiprows=1)
+    # Read the Excel file (parsed once, see read_user_workbook)
+    df = _read_sheet("My plant", skiprows=1)
     # Create a dictionary using zip and dictionary comprehension
     plant_dict = dict(zip(df['Ions'], df[plant_name]))
     return plant_dict
@@ -90,24 +132,190 @@ def import_plant_data(plant_name:str) -> dict:
 
 # ----- Molar mass calculator ------------------------
 
+#Process-wide index {atom: molar mass [g/mol]}, filled on first use by _atom_masses()
+_ATOM_MASSES = None
+
+def _atom_masses() -> dict:
+    """
+    Returns the atom-mass index, reading "molar_mass.csv" the first time it is needed.
+
+    Returns:
+        dict: dictionary with keys as atom symbols and values as their atomic mass in g/mol
+    """
+    global _ATOM_MASSES
+    if _ATOM_MASSES is None:
+        data_file = load_from_data("molar_mass.csv")
+        with open(data_file, mode='r') as file:
+            reader = csv.DictReader(file)
+            _ATOM_MASSES = {row['Atom']: float(row['Molar mass [g/mol]']) for row in reader}
+    return _ATOM_MASSES
+
+def reload_atom_masses() -> dict:
+    """
+    Drops the cached atom-mass index and reads "molar_mass.csv" again.
+    Use it after editing the CSV file in a running process. The molar solubilities and the Ksp values,
+    computed with the molar masses, are dropped as well (see reload_Ksp_registry).
+
+    Returns:
+        dict: the freshly loaded atom-mass index
+    """
+    global _ATOM_MASSES
+    _ATOM_MASSES = None
+    get_molar_mass.cache_clear()
+    formula_vector.cache_clear()
+    reload_Ksp_registry()
+    return _atom_masses()
+
 def get_atom_mass(atom_name: str) -> float:
     """
-    Gets the atomic mass of the atom from a CVS file
+    Gets the atomic mass of the atom from the atom-mass index (loaded once from a CSV file)
 
     Args:
         atom_name (str): Name of the atom, i.e. 'H', 'O', 'C', etc.
 
     Returns:
-        float: atomic mass of the atom in g/mol
+        float: atomic mass of the atom in g/mol, None if the atom is unknown
+    """
+    return _atom_masses().get(atom_name)
+
+#Special characters that are not allowed in a chemical formula
+_SPECIAL_CHARACTERS = re.compile(r'[!@#$%^&*_=\[\]{};\'\\:"|,.<>\/?]')
+#Tokens of a chemical formula: element symbol, count, brackets and charge signs
+_FORMULA_TOKENS = re.compile(r'([A-Z][a-z]?)|(\d+)|(\()|(\))|([+-])|(.)')
+#Content of a bracket that only carries a charge or an oxidation state, e.g. "(2+)", "(-)", "(III)"
+_CHARGE_GROUP = re.compile(r'\((?:\d*[+-]+|\d+|I{1,3}|IV|VI{0,3}|IX)\)')
+
+def _tokenize_formula(formula: str) -> list:
+    """
+    Splits a chemical formula into tokens, dropping the brackets that only carry a charge or an oxidation state.
+
+    Args:
+        formula (str): The chemical formula, e.g. "Ca(NO3)2" or "SO4(2-)".
+
+    Returns:
+        list: list of (kind, value) tuples, kind being "element", "count", "(", ")" or "sign".
+    """
+    if _SPECIAL_CHARACTERS.search(formula):
+        raise ValueError("Invalid input. The formula of the molcule can only contain letters,numbers, parentheses and '+' or '-' signs.")
+    tokens = []
+    for match in _FORMULA_TOKENS.finditer(_CHARGE_GROUP.sub("", formula)):
+        element, count, left, right, sign, other = match.groups()
+        if element:
+            tokens.append(("element", element))
+        elif count:
+            tokens.append(("count", int(count)))
+        elif left or right:
+            tokens.append((left or right, None))
+        elif sign:
+            tokens.append(("sign", sign))
+        else:
+            raise ValueError(f"Invalid character '{other}' in the formula {formula}.")
+    return tokens
+
+def _parse_group(tokens: list, i: int, formula: str) -> tuple:
+    """
+    Parses tokens from position i until the end of the formula or the closing bracket of the current group.
+
+    Returns:
+        tuple: (dictionary {element: count} of the group, position of the first token after the group)
+    """
+    counts = {}
+    while i < len(tokens):
+        kind, value = tokens[i]
+        if kind == ")":
+            return counts, i
+        if kind == "sign":
+            #Charges do not change the composition
+            i += 1
+            continue
+        if kind == "element":
+            group = {value: 1}
+            i += 1
+        elif kind == "(":
+            group, i = _parse_group(tokens, i+1, formula)
+            if i >= len(tokens):
+                raise ValueError(f"Unbalanced parentheses in the formula {formula}.")
+            i += 1
+        else:
+            raise ValueError(f"Unexpected number in the formula {formula}.")
+        multiplier = 1
+        if i < len(tokens) and tokens[i][0] == "count":
+            multiplier = tokens[i][1]
+            i += 1
+        for element, count in group.items():
+            counts[element] = counts.get(element, 0) + count*multiplier
+    return counts, i
+
+@lru_cache(maxsize=4096)
+def _parse_formula_cached(formula: str) -> tuple:
+    counts = {}
+    #Hydrates are written "CaSO4·2H2O", each part can start with a coefficient
+    for part in formula.split("·"):
+        coefficient = re.match(r'\d*', part).group()
+        tokens = _tokenize_formula(part[len(coefficient):])
+        part_counts, i = _parse_group(tokens, 0, formula)
+        if i != len(tokens):
+            raise ValueError(f"Unbalanced parentheses in the formula {formula}.")
+        for element, count in part_counts.items():
+            counts[element] = counts.get(element, 0) + count*int(coefficient or 1)
+    return tuple(counts.items())
+
+def parse_formula(formula: str) -> dict:
+    """
+    Counts the atoms of each element in a chemical formula.
+        Handles nested brackets, multi-digit counts, charges and hydrates, e.g. "Ca(NO3)2", "K4(Fe(CN)6)", "SO4(2-)", "CaSO4·2H2O".
+        Parsed formulas are kept in a bounded LRU cache.
+
+    Args:
+        formula (str): The chemical formula.
+
+    Returns:
+        dict: dictionary with keys as element symbols and values as the number of atoms.
+    """
+    return dict(_parse_formula_cached(formula))
+
+@lru_cache(maxsize=4096)
+def formula_vector(formula: str) -> np.ndarray:
     """
-    # Define the name of the CSV file
-    data_file = load_from_data("molar_mass.csv") #Check path to CSV file
-    with open(data_file, mode='r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            if row['Atom'] == atom_name:
-                return float(row['Molar mass [g/mol]'])
+    Element-count vector of a chemical formula, ordered like the rows of "molar_mass.csv" (see atom_symbols()).
+
+    Args:
+        formula (str): The chemical formula.
+
+    Returns:
+        np.ndarray: read-only vector with the number of atoms of each element.
+    """
+    index = {atom: i for i, atom in enumerate(_atom_masses())}
+    vector = np.zeros(len(index))
+    for element, count in _parse_formula_cached(formula):
+        if element not in index:
+            raise ValueError(f"Unknown element {element} in the formula {formula}.")
+        vector[index[element]] = count
+    vector.setflags(write=False)
+    return vector
+
+def atom_symbols() -> list:
+    """
+    Returns the element symbols in the order used by formula_vector().
+    """
+    return list(_atom_masses())
+
+def get_molar_masses(formulas: list) -> np.ndarray:
+    """
+    Molar masses of several formulas at once, as a matrix product of element-count vectors and atomic masses.
+
+    Args:
+        formulas (list): list of chemical formulas.
 
+    Returns:
+        np.ndarray: molar masses in g/mol, in the order of formulas.
+    """
+    if len(formulas) == 0:
+        return np.zeros(0)
+    counts = np.vstack([formula_vector(formula) for formula in formulas])
+    return counts @ np.fromiter(_atom_masses().values(), dtype=float)
+
+@lru_cache(maxsize=4096)
 def get_molar_mass(salt: str) -> float:
     """
     Calculate the molar mass of a salt in g/mol.
@@ -119,132 +327,19 @@ def get_molar_mass(salt: str) -> float:
             - "Ca(2+)(NO3-)2"
             - "Ca2(NO3)2"
             - "Ca(NO3)2(2+)"
-            Please do not use spaces in the formula and avoid putting brackets inside brackets.
+            - "K4(Fe(CN)6)"
+            Please do not use spaces in the formula.
 
     Returns:
         float: The molar mass of the salt in g/mol.
     """
-    #Check for special characters
-    def contains_special_characters(input_string:str):
-        # Define a regular expression pattern to match special characters
-        pattern = re.compile(r'[!@#$%^&*_=\[\]{};\'\\:"|,.<>\/?]')
-        # Use search method to find if any special characters exist in the input string
-        if pattern.search(input_string):
-            return True
-        else:
-            return False
-
-    def molar(molecule:str):
-        #Check for special characters
-        if contains_special_characters(molecule):
-            raise ValueError("Invalid input. The formula of the molcule can only contain letters,numbers, parentheses and '+' or '-' signs.")
-        
-        current_count = ""
-        current_element = ""
-        i=0
-        molar_mass = 0
-        #Test for charges and numbers
-        while molecule[-1] == "+" or molecule[-1] == "-":
-            molecule = molecule[:-1]
-            if len(molecule) == 0:
-                break
-        if molecule.isnumeric():
-            return 0   
-    
-        while i < len(molecule):
-            if i<len(molecule)-3:
-                if molecule[i].isupper() and molecule[i+1].islower() and molecule[i+2].isnumeric() and molecule[i+3].isnumeric():
-                    current_element = molecule[i]+molecule[i+1]
-                    current_count = molecule[i+2]+molecule[i+3]
-                    i+=4
-                    molar_mass += get_atom_mass(current_element)*int(current_count)
-                    continue
-                
-            if i<len(molecule)-2:
-                if molecule[i].isupper() and molecule[i+1].islower() and molecule[i+2].isnumeric():
-                    current_element = molecule[i]+molecule[i+1]
-                    current_count = molecule[i+2]
-                    i+=3
-                    molar_mass += get_atom_mass(current_element)*int(current_count)
-                    continue
-                    
-                if molecule[i].isupper() and molecule[i+1].islower() and molecule[i+2].isalpha():
-                    current_element = molecule[i]+molecule[i+1]
-                    current_count = 1
-                    i+=2
-                    molar_mass += get_atom_mass(current_element)*int(current_count)
-                    continue
-                
-                if molecule[i].isupper() and molecule[i+1].isnumeric() and molecule[i+2].isnumeric():
-                    current_element = molecule[i]
-                    current_count = molecule[i+1]+molecule[i+2]
-                    i+=2
-                    molar_mass += get_atom_mass(current_element)*int(current_count)
-                    continue
-            if i<len(molecule)-1:
-                if molecule[i].isupper() and molecule[i+1].isnumeric():
-                    current_element = molecule[i]
-                    current_count = molecule[i+1]
-                    i+=2
-                    molar_mass += get_atom_mass(current_element)*int(current_count)
-                    continue
-                elif molecule[i].isupper() and molecule[i+1].isupper():
-                    current_element = molecule[i]
-                    current_count = 1
-                    i+=1
-                    molar_mass += get_atom_mass(current_element)*int(current_count)
-                    continue
-            
-            if i == len(molecule)-2:
-                if molecule[i].isupper() and molecule[i+1].islower():
-                    current_element = molecule[i]+molecule[i+1]
-                    current_count = 1
-                    i+=2
-                    molar_mass += get_atom_mass(current_element)*int(current_count)
-                    continue
-                if molecule[i].isupper() and molecule[i+1].isupper():
-                    current_element = molecule[i]
-                    current_count = 1
-                    i+=1
-                    molar_mass += get_atom_mass(current_element)*int(current_count)
-                    continue
-                if molecule[i].isupper() and molecule[i+1].isnumeric():
-                    current_element = molecule[i]
-                    current_count = molecule[i+1]
-                    i+=2
-                    molar_mass += get_atom_mass(current_element)*int(current_count)
-                    continue  
-            if i == len(molecule)-1:
-                current_element = molecule[i]
-                current_count = 1
-                i+=1
-                molar_mass += get_atom_mass(current_element)*int(current_count)
-                continue
-            if molar_mass >=100000:
-                break
-
-        return molar_mass
-    
-    #Take care of brakets
-    M = 0    
-    while "(" in salt:
-        left = salt.index("(")
-        right = salt.index(")")
-        substing = salt[left+1:right]
-
-        if right != len(salt)-1:
-            if salt[right+1].isnumeric():
-                M += int(salt[right+1])*molar(substing)
-                salt = salt[:left] + salt[right+2:]
-            else:
-                M += molar(substing)
-                salt = salt[:left] + salt[right+1:]
-        else:
-            M += molar(substing)
-            salt = salt[:left] + salt[right+1:]
-            
-    total_molar_mass = M + molar(salt)
-    return total_molar_mass
+    atom_masses = _atom_masses()
+    molar_mass = 0
+    for element, count in _parse_formula_cached(salt):
+        if element not in atom_masses:
+            raise ValueError(f"Unknown element {element} in the formula {salt}.")
+        molar_mass += atom_masses[element]*count
+    return molar_mass
 
 
 
@@ -332,11 +427,84 @@ dict_salts_trad = {
 }
 
 
+#Process-wide registries, filled on first use by _molar_solubilities()
+_MOLAR_SOLUBILITIES = None # {formula: molar solubility [mol/L]}
+_KSP_VALUES = {}           # {formula: Ksp}
+
+def _molar_solubilities() -> dict:
+    """
+    Returns the molar solubility [mol/L] of every salt of "Solubility_data.csv", reading the file the first time it is needed.
+        The Ksp values of the salts of the salt2nbIons dictionary are precomputed at the same time.
+
+    Returns:
+        dict: dictionary with keys as salt formulas and values as their molar solubility in mol/L
+    """
+    global _MOLAR_SOLUBILITIES
+    if _MOLAR_SOLUBILITIES is None:
+        solubility_file = load_from_data("Solubility_data.csv")
+        solubilities = {}
+        with open(solubility_file, mode='r', encoding='utf-8') as file:
+            reader = csv.reader(file)
+            next(reader) # skip the header
+            for name, formula, value in reader:
+                if formula in solubilities: # the first row of a formula is used
+                    continue
+                solubility = float(value or "nan") *10 #go from g/100mL to g/L
+                solubilities[formula] = solubility/get_molar_mass(formula) #mol/L
+        _MOLAR_SOLUBILITIES = solubilities
+        _KSP_VALUES.clear()
+        for salt_name in salt2nbIons:
+            _KSP_VALUES[salt_name] = _compute_Ksp(salt_name)
+    return _MOLAR_SOLUBILITIES
+
+def _compute_Ksp(salt_name: str) -> float:
+    #Ksp = n^n * m^m * mol_sol^(n+m) for salt of type nXmY, 0 if the salt is not in the solubility table
+    if salt_name not in _MOLAR_SOLUBILITIES:
+        return 0
+    mol_sol = _MOLAR_SOLUBILITIES[salt_name]
+    ions = salt2nbIons[salt_name]
+    if len(ions) <=1:
+        return mol_sol
+    n = ions[0]
+    m = ions[1]
+    return (n**n)*(m**m)*(mol_sol**(n+m))
+
+def reload_Ksp_registry() -> None:
+    """
+    Drops the cached solubility table and Ksp values, they are rebuilt on the next call to get_Ksp.
+    Use it after editing "Solubility_data.csv" or the salt2nbIons dictionary in a running process.
+    """
+    global _MOLAR_SOLUBILITIES, _SALT_CATALOG
+    _MOLAR_SOLUBILITIES = None
+    _SALT_CATALOG = None
+    _KSP_VALUES.clear()
+
+def _shared_tables() -> tuple:
+    """
+    Returns the loaded atom-mass index and solubility registry, to hand them to worker processes.
+    """
+    _atom_masses()
+    _molar_solubilities()
+    return (_ATOM_MASSES, _MOLAR_SOLUBILITIES, dict(_KSP_VALUES))
+
+def _install_tables(tables: tuple) -> None:
+    """
+    Installs tables returned by _shared_tables() in this process instead of reading the data files.
+    """
+    global _ATOM_MASSES, _MOLAR_SOLUBILITIES, _SALT_CATALOG
+    _ATOM_MASSES, _MOLAR_SOLUBILITIES, Ksp_values = tables
+    _SALT_CATALOG = None
+    _KSP_VALUES.clear()
+    _KSP_VALUES.update(Ksp_values)
+    get_molar_mass.cache_clear()
+    formula_vector.cache_clear()
+
 # Get the solubility constant Ksp of a salt
 def get_Ksp(salt_name: str) -> float:
     """
     Access the solubility product constant (Ksp) of a salt based on its name. 
         Uses a salt2nbIons dictionary to find the number of ions in a salt.
+        The solubility table is read once per process and the Ksp values are precomputed.
 
     Args:
         salt_name (str): The formula of the salt. Use standard notation for the formula,
@@ -345,24 +513,175 @@ def get_Ksp(salt_name: str) -> float:
     Returns:
         float: The solubility product constant (Ksp) of the salt.
     """
-    solubility_file = load_from_data("Solubility_data.csv")
-    df_solubility = pd.read_csv(solubility_file)
-    
-    row = df_solubility.loc[df_solubility["Formula"] == salt_name].values.tolist() # [[name, formula, value]]
-    Ksp = 0
-    if row:
-        solubility = float(row[0][2]) *10 #go from g/100mL to g/L
-        mol_sol = solubility/get_molar_mass(salt_name) #mol/L
-        
-        #Ksp = n^n * m^m * mol_sol^(n+m) for salt of type nXmY
-        ions = salt2nbIons[salt_name]
-        if len(ions) <=1:
-            Ksp = mol_sol
-        else: 
-            n = ions[0]
-            m = ions[1]
-            Ksp = (n**n)*(m**m)*(mol_sol**(n+m))
-    return Ksp 
+    _molar_solubilities()
+    if salt_name not in _KSP_VALUES:
+        _KSP_VALUES[salt_name] = _compute_Ksp(salt_name)
+    return _KSP_VALUES[salt_name]
+
+def get_Ksp_many(salts: list) -> np.ndarray:
+    """
+    Access the solubility product constants (Ksp) of several salts at once.
+
+    Args:
+        salts (list): list of salt formulas.
+
+    Returns:
+        np.ndarray: the Ksp values, in the order of salts.
+    """
+    return np.array([get_Ksp(salt_name) for salt_name in salts], dtype=float)
+
+#------ Salt catalog -----------------------------
+class SaltCatalog:
+    """
+    Compiled form of dict_salts_trad and salt2nbIons: the salts and the ions get fixed indices and the
+    stoichiometry is stored in dense matrices [salts x ions], so that the conversions between salts and ions are matrix products.
+    The ions are identified with the ion registry (see Ion_Registry), the names of a same ion (e.g. "NH(4+)" and "NH4+") share a column.
+    Use salt_catalog() to get the cached catalog of dict_salts_trad, and register_salt() to add a salt.
+
+    Attributes:
+        salts (list): the salts, in the order of dict_salts_trad.
+        salt_index (dict): {salt: row}.
+        ions (list): the canonical names of the ions, in the order of their first appearance in dict_salts_trad.
+        ion_ids (np.ndarray): the IDs of the ions in the ion registry.
+        ion_index (dict): {ion ID: column}.
+        stoichiometry (np.ndarray): number of each ion in each salt, from dict_salts_trad [salts x ions].
+        exponents (np.ndarray): exponent of each ion in the solubility product of each salt, from salt2nbIons [salts x ions].
+        salt_ions (list): for each salt, the columns of its ions in the order of dict_salts_trad.
+        log_Ksp (np.ndarray): log of the Ksp of each salt (-inf if it is not in the solubility table).
+    """
+    def __init__(self, salts_ions: dict, salts_nb_ions: dict):
+        self.salts = list(salts_ions)
+        self.salt_index = {salt: i for i, salt in enumerate(self.salts)}
+        self.ion_index = {}
+        for ions in salts_ions.values():
+            for ion in ions:
+                self.ion_index.setdefault(ion_id(ion), len(self.ion_index))
+        self.ion_ids = np.array(list(self.ion_index), dtype=int)
+        self.ions = [ion_name(ion) for ion in self.ion_ids]
+        self.stoichiometry = np.zeros((len(self.salts), len(self.ions)))
+        self.exponents = np.zeros((len(self.salts), len(self.ions)))
+        self.salt_ions = []
+        for i, salt in enumerate(self.salts):
+            columns = np.array([self.ion_index[ion_id(ion)] for ion in salts_ions[salt]], dtype=int)
+            self.salt_ions.append(columns)
+            self.stoichiometry[i, columns] = list(salts_ions[salt].values())
+            #salt2nbIons gives the exponents in the order of the ions of dict_salts_trad
+            self.exponents[i, columns] = salts_nb_ions[salt]
+        with np.errstate(divide="ignore"):
+            self.log_Ksp = np.log(get_Ksp_many(self.salts))
+        self._ion_masses = {}
+
+    def column(self, ion: str):
+        """
+        Returns the column of an ion from any of its names, None if no salt brings the ion.
+        """
+        return self.ion_index.get(ion_id(ion))
+
+    def salt_vector(self, amounts: dict) -> np.ndarray:
+        """
+        Returns the amounts of the salts of a solution as a vector in the order of the catalog.
+        """
+        vector = np.zeros(len(self.salts))
+        for salt, amount in amounts.items():
+            if salt not in self.salt_index:
+                raise ValueError(f"Salt {salt} not found in the 'dict_salts_trad' dictionary.")
+            vector[self.salt_index[salt]] += amount
+        return vector
+
+    def ion_vector(self, amounts: dict) -> np.ndarray:
+        """
+        Returns the amounts of the ions of a solution as a vector in the order of the catalog, ions of no salt are left out.
+        """
+        vector = np.zeros(len(self.ions))
+        for ion, amount in amounts.items():
+            column = self.column(ion)
+            if column is not None:
+                vector[column] = amount
+        return vector
+
+    def ions_of(self, salts) -> list:
+        """
+        Returns the columns of the ions of some salts, in the order of their first appearance.
+        """
+        return list(dict.fromkeys(int(column) for salt in salts for column in self.salt_ions[self.salt_index[salt]]))
+
+    def ion_masses(self, columns) -> np.ndarray:
+        """
+        Returns the molar masses of the ions of some columns, computed once for each set of columns.
+        """
+        columns = tuple(columns)
+        if columns not in self._ion_masses:
+            self._ion_masses[columns] = get_molar_masses([ion_formula(self.ions[j]) for j in columns])
+        return self._ion_masses[columns]
+
+    def salts_with(self, ions, forbidden_ions=()) -> np.ndarray:
+        """
+        Returns a boolean mask of the salts bringing at least one of ions and none of forbidden_ions.
+        """
+        columns = [self.column(ion) for ion in ions]
+        forbidden_columns = [self.column(ion) for ion in forbidden_ions]
+        brings = self.stoichiometry[:, [column for column in columns if column is not None]] > 0
+        forbidden = self.stoichiometry[:, [column for column in forbidden_columns if column is not None]] > 0
+        return brings.any(axis=1) & ~forbidden.any(axis=1)
+
+    def provides(self, salts, ions) -> list:
+        """
+        Returns True for each of ions brought by at least one of salts.
+        """
+        provided = self.stoichiometry[[self.salt_index[salt] for salt in salts]].sum(axis=0) > 0
+        return [column is not None and bool(provided[column]) for column in map(self.column, ions)]
+
+    def stoichiometry_of(self, salts, ions) -> tuple:
+        """
+        Returns the stoichiometry matrix [ions x salts] of some salts, with a row for each of ions followed by a row for
+        each other ion brought by the salts.
+
+        Returns:
+            tuple: (names of the ions of the rows, stoichiometry matrix)
+        """
+        rows = [self.column(ion) for ion in ions]
+        given = set(rows)
+        extra = [column for column in self.ions_of(salts) if column not in given]
+        matrix = np.zeros((len(rows) + len(extra), len(salts)))
+        salt_rows = [self.salt_index[salt] for salt in salts]
+        for i, column in enumerate(rows + extra):
+            if column is not None:
+                matrix[i] = self.stoichiometry[salt_rows, column]
+        return list(ions) + [self.ions[column] for column in extra], matrix
+
+#Catalog of dict_salts_trad, see salt_catalog()
+_SALT_CATALOG = None
+
+def salt_catalog() -> SaltCatalog:
+    """
+    Returns the catalog of the salts of dict_salts_trad, compiled once and rebuilt when a salt is added.
+
+    Returns:
+        SaltCatalog: the compiled salts.
+    """
+    global _SALT_CATALOG
+    if _SALT_CATALOG is None or len(_SALT_CATALOG.salts) != len(dict_salts_trad) or _SALT_CATALOG.salts != list(dict_salts_trad):
+        _SALT_CATALOG = SaltCatalog(dict_salts_trad, salt2nbIons)
+    return _SALT_CATALOG
+
+def register_salt(salt_name: str, ions: dict, nb_ions: list = None) -> SaltCatalog:
+    """
+    Adds a salt to dict_salts_trad and salt2nbIons and rebuilds the catalog.
+
+    Args:
+        salt_name (str): formula of the salt, e.g. "KI".
+        ions (dict): dictionary with keys as the ions of the salt and values as their number in the salt.
+        nb_ions (list, optional): exponents of the ions in the solubility product. Defaults to the numbers of ions.
+
+    Returns:
+        SaltCatalog: the new catalog.
+    """
+    global _SALT_CATALOG
+    dict_salts_trad[salt_name] = dict(ions)
+    salt2nbIons[salt_name] = list(nb_ions) if nb_ions is not None else list(ions.values())
+    _KSP_VALUES.pop(salt_name, None)
+    _SALT_CATALOG = None
+    return salt_catalog()
 
 # Get the solubility product Q of a salt
 def get_Q_solubility(salt_name: str, ions_in_solution: dict) -> float:
@@ -376,14 +695,17 @@ def get_Q_solubility(salt_name: str, ions_in_solution: dict) -> float:
     Returns:
         float: solubility product Q
     '''
-    Q = 1
-    i=0
-    for ion in dict_salts_trad[salt_name]:
-        if ion in ions_in_solution:
-            Q *= ions_in_solution[ion]**salt2nbIons[salt_name][i]
-            i+=1
-            
-    return Q
+    catalog = salt_catalog()
+    salt = catalog.salt_index[salt_name]
+    #The names of a same ion (e.g. "CO3" and "CO3(2-)") add up
+    concentrations = {}
+    for ion, concentration in ions_in_solution.items():
+        column = catalog.column(ion)
+        concentrations[column] = concentrations.get(column, 0) + concentration
+    present = [concentrations[column] for column in catalog.salt_ions[salt] if column in concentrations]
+    #The exponents are taken in order for the ions present in the solution
+    exponents = catalog.exponents[salt, catalog.salt_ions[salt][:len(present)]]
+    return float(np.prod(np.array(present, dtype=float)**exponents))
 
 
 
@@ -411,40 +733,135 @@ def salt2ions(solution: dict, volume: float = 1, unit: str = "g") -> dict:
     """
     if volume <= 0:
         raise ValueError("Volume must be positive.")
+    if unit not in {"g", "mol"}:
+        raise ValueError("'Unit' must be 'g' or 'mol'.")
+    catalog = salt_catalog()
+    if unit == "g":
+        #Concentrations of the salts in mol/L
+        solution = {salt: mass / get_molar_mass(salt) for salt, mass in solution.items()}
+    # Sum of the molar concentrations of the salts, weighted by the number of each ion
+    ions = catalog.salt_vector(solution) @ catalog.stoichiometry
+    columns = catalog.ions_of(solution)
     if unit == "mol":
-        ions = {}
-        for salt in solution:
-            if salt in dict_salts_trad:
-                for ion in dict_salts_trad[salt].keys():
-                    if ion in ions:
-                        ions[ion] += dict_salts_trad[salt][ion] * solution[salt]
-                    else:
-                        ions[ion] = dict_salts_trad[salt][ion] * solution[salt]
-            else:
-                raise ValueError(f"Salt {salt} not found in the 'dict_salts_trad' dictionary.")
-            
-        ions_in_solution = {n: volume * ions[n] for n in ions.keys()}    
-        return ions_in_solution
-    
-    elif unit == "g":
-        salts = {salt: mass/get_molar_mass(salt) for salt, mass in solution.items()}
-        ions = {}
-        for salt in salts:
-            if salt in dict_salts_trad:
-                for ion in dict_salts_trad[salt].keys():
-                    if ion in ions:
-                        ions[ion] += dict_salts_trad[salt][ion] * solution[salt]
-                    else:
-                        ions[ion] = dict_salts_trad[salt][ion] * solution[salt]
-            else:
-                raise ValueError(f"Salt {salt} not found in the 'dict_salts_trad' dictionary.")
-        ions_in_solution = {ion: float(get_molar_mass(ion)) * float(volume) * ions[ion] for ion in ions.keys()}
-        return ions_in_solution
-    else:
+        return {catalog.ions[j]: volume * float(ions[j]) for j in columns}
+    return {catalog.ions[j]: float(mass) * float(volume) * float(ions[j]) for j, mass in zip(columns, catalog.ion_masses(columns))}
+
+def salt2ions_batch(recipes, volume: float = 1, unit: str = "g", salts: list = None):
+    """
+    Converts many recipes at once with salt2ions, as one matrix product.
+
+    Args:
+        recipes (pd.DataFrame or np.ndarray): concentrations of the salts [recipes x salts]. The columns of a DataFrame are the salts.
+        volume (float, optional): Volume of the solutions. Defaults to 1.
+        unit (str, optional): Unit of concentration. Defaults to "g". Options are "g" or "mol".
+        salts (list, optional): names of the salts of the columns, required if recipes is an array.
+
+    Returns:
+        pd.DataFrame or np.ndarray: the ions of each recipe [recipes x ions], as given by salt2ions.
+            The ions are in the order of the keys of salt2ions, the columns of a DataFrame are the ions.
+    """
+    if volume <= 0:
+        raise ValueError("Volume must be positive.")
+    if unit not in {"g", "mol"}:
         raise ValueError("'Unit' must be 'g' or 'mol'.")
+    table = recipes if hasattr(recipes, "columns") else None
+    if table is not None:
+        salts = list(table.columns)
+    elif salts is None:
+        raise ValueError("The names of the salts must be given with an array of recipes.")
+    amounts = np.atleast_2d(np.asarray(recipes, dtype=float))
+    if amounts.shape[1] != len(salts):
+        raise ValueError("The number of columns must match the number of salts.")
+    catalog = salt_catalog()
+    for salt in salts:
+        if salt not in catalog.salt_index:
+            raise ValueError(f"Salt {salt} not found in the 'dict_salts_trad' dictionary.")
+    columns = catalog.ions_of(salts)
+    factors = np.full(len(columns), float(volume))
+    if unit == "g":
+        #Concentrations of the salts in mol/L, and ions back in g/L
+        amounts = amounts / get_molar_masses(salts)
+        factors = factors * catalog.ion_masses(columns)
+    stoichiometry = catalog.stoichiometry[[catalog.salt_index[salt] for salt in salts]][:, columns]
+    ions = (amounts @ stoichiometry) * factors
+    if table is None:
+        return ions
+    import pandas as pd
+    return pd.DataFrame(ions, index=table.index, columns=[catalog.ions[j] for j in columns])
+
+#Non-negative least squares, used by the numeric backend of make_solution
+def _nnls(A: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Solves min ||Ax - b|| subject to x >= 0 with the active-set method of Lawson and Hanson.
+
+    Args:
+        A (np.ndarray): matrix [m x n].
+        b (np.ndarray): vector [m].
+
+    Returns:
+        np.ndarray: the non-negative solution x [n].
+    """
+    m, n = A.shape
+    x = np.zeros(n)
+    passive = np.zeros(n, dtype=bool)
+    tol = 10 * np.finfo(float).eps * np.abs(A).sum(axis=0).max(initial=0) * max(m, n)
+    gradient = A.T @ b
+    for _ in range(3*n):
+        if passive.all() or gradient[~passive].max() <= tol:
+            break
+        passive[np.argmax(np.where(passive, -np.inf, gradient))] = True
+        while True:
+            z = np.zeros(n)
+            z[passive] = np.linalg.lstsq(A[:, passive], b, rcond=None)[0]
+            if (z[passive] > tol).all():
+                x = z
+                break
+            #Step back to the feasible region and drop the variables that reach zero
+            negative = passive & (z <= tol)
+            alpha = np.min(x[negative] / (x[negative] - z[negative]))
+            x = x + alpha * (z - x)
+            passive &= x > tol
+            x[~passive] = 0
+        gradient = A.T @ (b - A @ x)
+    return x
+
+def _row_weights(wanted: np.ndarray) -> np.ndarray:
+    """
+    Weights of the rows of a least squares problem on quantities of ions, so that the relative error of each ion is
+    minimized: a trace nutrient counts as much as a macro nutrient. The rows of the ions wanted at 0 are weighted by
+    the largest quantity wanted.
+    """
+    largest = wanted.max(initial=0)
+    if largest <= 0:
+        return np.ones(len(wanted))
+    return 1/np.where(wanted > 0, wanted, largest)
+
+def _make_solution_numeric(molar_ions: dict, forbidden_ions: list, volume: float) -> dict:
+    """
+    Numeric backend of make_solution: the amount of each salt is the non-negative least squares solution
+    of the stoichiometry matrix [ions x salts] against the wanted quantity of each ion [mol], each row being
+    divided by its target (see _row_weights) so that the relative errors are minimized.
+    Ions brought by a salt but not wanted are asked to stay at 0.
+    """
+    catalog = salt_catalog()
+    candidates = catalog.salts_with(molar_ions, forbidden_ions)
+    possible_salts = [salt for salt, candidate in zip(catalog.salts, candidates)
+                      if candidate and get_Ksp(salt) > get_Q_solubility(salt, molar_ions)]
+    provided = catalog.provides(possible_salts, molar_ions)
+    missing_ions = [ion for ion, ok in zip(molar_ions, provided) if molar_ions[ion] > 0 and not ok]
+    if missing_ions:
+        raise ValueError(f"No solution found: no allowed soluble salt provides {missing_ions}. Please check the ions in the solution and the forbidden ions.")
+    
+    ions, stoichiometry = catalog.stoichiometry_of(possible_salts, molar_ions)
+    wanted = np.array([molar_ions.get(ion, 0) * volume for ion in ions])
+    
+    weights = _row_weights(wanted)
+    moles = _nnls(weights[:, None]*stoichiometry, weights*wanted)
+    return {salt: float(moles[j]*get_molar_mass(salt)) for j, salt in enumerate(possible_salts) if moles[j] > 0}
 
 #Make a solution given the ion concentration wanted
-def make_solution (ions_in_solution :dict, forbidden_ions:list, volume:float, )->dict:
+@instrumented()
+def make_solution (ions_in_solution :dict, forbidden_ions:list, volume:float, backend: str = "sympy")->dict:
     '''
     Returns how much of each salt [g] to add to a solution of certain volume [L]
     to obtain a certain concentration of ions [g/L]
@@ -453,16 +870,25 @@ def make_solution (ions_in_solution :dict, forbidden_ions:list, volume:float, )-
         ions_in_solution (dict): dictionary with keys as ions and values as the concentration in g/L.
         forbidden_ions (list): list of ions that cannot be in the solution.
         volume (float): volume of the final solution in L.
+        backend (str, optional): "sympy" solves the equations symbolically with one salt per ion,
+            "numeric" uses non-negative least squares over all the allowed salts (always non-negative masses,
+            closest achievable composition if the exact one is not possible). Defaults to "sympy".
     
     Returns:
         dict: dictionary with keys as salt names and values as the amount of salt needed in g.
     '''
+    if backend not in {"sympy", "numeric"}:
+        raise ValueError("Invalid backend. Please choose either 'sympy' or 'numeric'.")
     
     if set(ions_in_solution.keys()).intersection(forbidden_ions) != set() :
         problems = set(ions_in_solution.keys()).intersection(forbidden_ions)
         raise ValueError(f"Forbidden ions are required in the solution: {problems}")
     
-    molar_ions = {ion: ions_in_solution[ion]/get_molar_mass(ion) for ion in ions_in_solution}
+    molar_ions = {ion: ions_in_solution[ion]/get_molar_mass(ion_formula(ion)) for ion in ions_in_solution}
+    if backend == "numeric":
+        return _make_solution_numeric(molar_ions, forbidden_ions, volume)
+    from sympy import symbols, Eq, solve, solveset, Interval
+    
     # Define variables
     possible_salts = []
     for salt in dict_salts_trad.keys():
@@ -513,3 +939,8 @@ def make_solution (ions_in_solution :dict, forbidden_ions:list, volume:float, )-
         return mass_salts
         
         
+
+#Caches reported by the instrumentation
+register_cache("parse_formula", _parse_formula_cached)
+register_cache("formula_vector", formula_vector)
+register_cache("get_molar_mass", get_molar_mass)
@@ -4,16 +4,23 @@ This file contains the functions needed in order to generate an automatic report
 
 #Imports
 import os
+import io
+import json
+import math
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer, Image
 from reportlab.lib.styles import getSampleStyleSheet
 
 from .Basic_functions import make_solution
-from .Solutions_Solubility import plot_graph, data4graph
+from .Solutions_Solubility import simulate_growth, _ion_graph_data, _ion_graph_path
+from .Render_Figures import render_figures, render_figure_bytes
+from .Instrumentation import instrumented, timed
 from .PH_Approximation_0 import *
 from .pH_graph_0 import *
+from .pH_graph_0 import _pH_figure_jobs
 
 # Auxiliar functions
 def merge_dicts(dict1, dict2, ions_of_interest = "all"):
@@ -45,6 +52,56 @@ def merge_dicts(dict1, dict2, ions_of_interest = "all"):
     
     return [ion_names, values_dict1, values_dict2]
 
+#---------- Computations shared by the sections ---------------------------------
+
+def _cached(cache: dict, key: str, compute):
+    # Results of identical computations are shared between the reports of a batch
+    if cache is None:
+        return compute()
+    if key not in cache:
+        cache[key] = compute()
+    return cache[key]
+
+def _simulation_key(spec: dict) -> str:
+    return json.dumps([spec["solution_composition"], spec["solution_volume"], spec["required_nutriments"], spec["growth_time"]],
+                      sort_keys=True, default=str)
+
+def _report_key(spec: dict) -> str:
+    return json.dumps([spec[key] for key in ("plant_name", "required_nutriments", "growth_time", "ions_of_interest",
+                                              "solution_composition", "solution_volume", "forbidden_ions")], sort_keys=True, default=str)
+
+@instrumented()
+def _report_results(spec: dict, figure_dir: str, dpi: float = 500, cache: dict = None, simulation: dict = None) -> dict:
+    """
+    Computes everything the report needs, simulating the growth only once, and renders the figures
+    into figure_dir, or in memory if figure_dir is None.
+    """
+    solution_key = json.dumps([spec["solution_composition"], spec["forbidden_ions"], spec["solution_volume"]], sort_keys=True, default=str)
+    salt_composition = _cached(cache, "salts" + solution_key, lambda: make_solution(
+        spec["solution_composition"], spec["forbidden_ions"], spec["solution_volume"]))
+    
+    simulation_key = _simulation_key(spec)
+    if simulation is None:
+        simulation = _cached(cache, "simulation" + simulation_key, lambda: simulate_growth(
+            spec["solution_composition"], spec["solution_volume"], spec["required_nutriments"], spec["growth_time"]))
+    temp = int(25)
+    pH_values, Days_where_pH_was_exceeded = _cached(cache, f"pH{temp}{spec['plant_name']}" + simulation_key,
+        lambda: generation_of_pH_list(simulation, temp, spec["plant_name"]))
+    
+    ion_graph = _ion_graph_data(spec["ions_of_interest"], simulation)
+    jobs = [{"kind": "ions", "data": ion_graph, "path": _ion_graph_path(figure_dir, spec["ions_of_interest"]), "dpi": dpi, "figsize": (12, 6)}]
+    jobs += _pH_figure_jobs(pH_values, Days_where_pH_was_exceeded, spec["plant_name"], figure_dir, dpi, "png")
+    if figure_dir is None:
+        ion_graph, pH_graph, pH_table = [render_figure_bytes(job["kind"], job["data"], job["dpi"], "png", job.get("figsize", (6.4, 4.8)))
+                                         for job in jobs]
+    else:
+        ion_graph, pH_graph, pH_table = render_figures(jobs, processes=1)
+    return {"salt_composition": salt_composition, "ion_graph": ion_graph, "pH_graph": pH_graph, "pH_table": pH_table}
+
+def _figure(figure):
+    # Path of the figure, or buffer for a figure rendered in memory
+    return io.BytesIO(figure) if isinstance(figure, bytes) else figure
+
 #---------- Main function ---------------------------------
 
 def generate_report(
@@ -55,8 +112,12 @@ def generate_report(
     solution_composition: dict,
     solution_volume: float,
     forbidden_ions: list = [],
-
-) -> None:
+    output_path: str = "hydroponic_report.pdf",
+    figure_dir: str = None,
+    dpi: float = 500,
+    simulation: dict = None,
+    verbose: bool = True,
+) -> str:
     """
     Generates a simulation report in PDF format based on the provided parameters.
 
@@ -68,13 +129,39 @@ def generate_report(
         ions_of_interest (list): A list of ions for which the concentration is of interest.
         growth_time (float): The duration of the growth of the plant [days].
         forbidden_ions (list, default): A list of ions that are forbidden in the solution.
+        output_path (str or file-like, default): The path of the pdf, or a binary file-like object to write it to.
+            Defaults to "hydroponic_report.pdf" in the current directory. If None, the pdf is returned as bytes.
+        figure_dir (str, default): A folder to also save the figures of the report in. By default the figures are
+            only rendered in memory and no file is written apart from the pdf.
+        dpi (float, default): The resolution of the figures. Defaults to 500.
+        simulation (dict, default): The result of simulate_growth for this solution, plant and growth time, if it is already known.
+        verbose (bool, default): Prints the progress of the report. Defaults to True.
 
     Returns:
-        None: a pdf is created in the folder of this file
+        str or bytes: the path of the pdf, or its content if output_path is None.
     """
-    print("Generating report...")
+    spec = {"plant_name": plant_name, "required_nutriments": required_nutriments, "growth_time": growth_time,
+            "ions_of_interest": ions_of_interest, "solution_composition": solution_composition,
+            "solution_volume": solution_volume, "forbidden_ions": forbidden_ions}
+    if verbose:
+        print("Generating report...")
+    results = _report_results(spec, figure_dir, dpi, simulation=simulation)
+    if output_path is None:
+        buffer = io.BytesIO()
+        _build_report(spec, buffer, results, verbose)
+        return buffer.getvalue()
+    return _build_report(spec, output_path, results, verbose)
+
+def _build_report(spec: dict, output_path: str, results: dict, verbose: bool = True) -> str:
+    plant_name = spec["plant_name"]
+    required_nutriments = spec["required_nutriments"]
+    growth_time = spec["growth_time"]
+    ions_of_interest = spec["ions_of_interest"]
+    solution_composition = spec["solution_composition"]
+    solution_volume = spec["solution_volume"]
+    forbidden_ions = spec["forbidden_ions"]
     # PageTemplate of the document
-    doc = SimpleDocTemplate("hydroponic_report.pdf", pagesize=letter)
+    doc = SimpleDocTemplate(output_path, pagesize=letter)
     story = []
     interest_ions = ", ".join(ions_of_interest)
     nono_ions = ", ".join(forbidden_ions)
@@ -127,7 +214,8 @@ def generate_report(
     # Add the table to the story
     story.append(table)
     story.append(Spacer(1, 12))
-    print("Collecting the data ...")
+    if verbose:
+        print("Collecting the data ...")
     # 2. Preparation of the solution ---------------------------------------------------------
     subtitle = Paragraph(" 2. Preparation of the solution", subtitle_style)
     story.append(subtitle)
@@ -144,7 +232,7 @@ def generate_report(
     story.append(Spacer(1, 12))
     
     #Add table: "salts to add in the solution"
-    salt_composition = make_solution(solution_composition, forbidden_ions ,solution_volume)
+    salt_composition = results["salt_composition"]
     headers = ["Salts"]+list(salt_composition.keys())
     data = list(salt_composition.values())
     data = [round(float(elem), 4) for elem in data]
@@ -172,24 +260,14 @@ def generate_report(
     story.append(Paragraph(ion_figure_text, paragraph_style))
     story.append(Spacer(1, 12))
     
-    # Make the graph
-    plot_graph(solution_composition, "ion", required_nutriments, growth_time, solution_volume, ions_of_interest)
-    
-    # Get the path of the graph
-    current_dir = os.path.dirname(os.path.realpath(__file__))
-    file_name = "graph_"
-    for ion in ions_of_interest:
-        file_name += str(ion) + "_"
-    file_name += ".png"
-    file_path = os.path.join(current_dir, file_name)
-
     # Add the image to the story and center it
-    image = Image(file_path, width=600, height=300)
+    image = Image(_figure(results["ion_graph"]), width=600, height=300)
     image.hAlign = 'CENTER'
     story.append(image)
     story.append(Spacer(1, 12))
     
-    print("Simulating the plant growth...")
+    if verbose:
+        print("Simulating the plant growth...")
     # 4. pH of the solution ---------------------------------------------------------
     subtitle = Paragraph(" 4. pH of the solution", subtitle_style)
     story.append(subtitle)
@@ -201,32 +279,88 @@ def generate_report(
     story.append(Paragraph(pH_text, paragraph_style))
     story.append(Spacer(1, 12))
     
-    #Generate the data
-    solution_pH = data4graph(solution_composition,solution_volume,required_nutriments,growth_time)[1]
-    temp = int(25)
-    pH_part_of_report_generation(solution_pH, temp, plant_name) #create images
-    
-    # Get the path of the pH_graph
-    current_dir = os.path.dirname(os.path.realpath(__file__))
-    file_name = "graph_pH.png"
-    file_path = os.path.join(current_dir, file_name)
     # Add the image to the story and center it
-    image = Image(file_path, width=600, height=300)
+    image = Image(_figure(results["pH_graph"]), width=600, height=300)
     image.hAlign = 'CENTER'
     story.append(image)
     story.append(Spacer(1, 12))
     
-    # Get the path of the pH_table
-    current_dir = os.path.dirname(os.path.realpath(__file__))
-    file_name = "Table_pH.png"
-    file_path = os.path.join(current_dir, file_name)
-    # Add the image to the story and center it
-    image = Image(file_path, width=300, height=300)
+    # Add the pH table to the story and center it
+    image = Image(_figure(results["pH_table"]), width=300, height=300)
     image.hAlign = 'CENTER'
     story.append(image)
     story.append(Spacer(1, 12))
     
     # Build the PDF
-    doc.build(story)
-    print("Report generated successfully!")
+    with timed("Generate_Report.build_pdf"):
+        doc.build(story)
+    if verbose:
+        print("Report generated successfully!")
+    return output_path
+
+#---------- Batch of reports ---------------------------------
+
+def _report_results_chunk(chunk: list) -> list:
+    # The reports of a chunk share their simulations
+    cache = {}
+    return [_report_results(spec, figure_dir, dpi, cache) for spec, figure_dir, dpi in chunk]
+
+def _build_report_chunk(chunk: list) -> list:
+    return [_build_report(spec, output_path, results, verbose=False) for spec, output_path, results in chunk]
+
+def _chunks(items: list, processes: int) -> list:
+    chunk_size = max(1, math.ceil(len(items)/(4*processes)))
+    return [items[i:i+chunk_size] for i in range(0, len(items), chunk_size)]
+
+def generate_reports(specs: list, output_dir: str, processes: int = None, dpi: float = 150) -> list:
+    """
+    Generates many reports in a pool of processes. The solution, the simulation, the pH and the figures
+    are computed once for all the reports with the same content, then the pdfs are built in parallel.
+
+    Args:
+        specs (list): list of dictionaries with the arguments of generate_report (plant_name, required_nutriments, growth_time,
+            ions_of_interest, solution_composition, solution_volume and optionally forbidden_ions), and optionally a "name"
+            for the pdf (defaults to "report_<index>").
+        output_dir (str): The folder of the pdfs. The figures are saved in output_dir/figures.
+        processes (int, optional): number of worker processes, 1 builds the reports in the current process. Defaults to the number of CPUs.
+        dpi (float, optional): The resolution of the figures. Defaults to 150, enough for the size of the figures in the pdf.
+
+    Returns:
+        list: the paths of the pdfs, in the order of specs.
+    """
+    names, reports = [], []
+    for i, spec in enumerate(specs):
+        spec = dict(spec)
+        names.append(spec.pop("name", f"report_{i}"))
+        spec.setdefault("forbidden_ions", [])
+        reports.append(spec)
+    
+    # Reports with the same content share their results and figures, sorted to share the simulations in the chunks
+    unique = {}
+    for spec in reports:
+        unique.setdefault(_report_key(spec), spec)
+    keys = sorted(unique, key=lambda key: _simulation_key(unique[key]))
+    figure_jobs = []
+    for key in keys:
+        figure_dir = os.path.join(output_dir, "figures", hashlib.sha256(key.encode()).hexdigest()[:16])
+        os.makedirs(figure_dir, exist_ok=True)
+        figure_jobs.append((unique[key], figure_dir, dpi))
     
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        executor = None
+        map_chunks = map
+    else:
+        executor = ProcessPoolExecutor(max_workers=processes)
+        map_chunks = executor.map
+    try:
+        results = {}
+        for chunk_keys, chunk_results in zip(_chunks(keys, processes), map_chunks(_report_results_chunk, _chunks(figure_jobs, processes))):
+            results.update(zip(chunk_keys, chunk_results))
+        
+        pdf_jobs = [(spec, os.path.join(output_dir, f"{name}.pdf"), results[_report_key(spec)]) for name, spec in zip(names, reports)]
+        list(map_chunks(_build_report_chunk, _chunks(pdf_jobs, processes)))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return [output_path for _, output_path, _ in pdf_jobs]
@@ -0,0 +1,137 @@
+"""
+This file contains the instrumentation of the hot paths of the package: per-function timers, call counters
+and cache hit/miss counts.
+
+It is switched on by the environment variable HYDROPONICS_INSTRUMENTATION=1, read when the package is imported.
+When it is off, the decorators return the functions unchanged, so the instrumentation costs nothing.
+"""
+
+#Imports
+import os
+import time
+import functools
+import threading
+import contextlib
+
+ENABLED = os.environ.get("HYDROPONICS_INSTRUMENTATION", "").lower() not in {"", "0", "false", "no"}
+
+#Statistics: {name: [calls, total time [s], maximum time [s]]} and {name: count}
+_TIMERS = {}
+_COUNTERS = {}
+#Functions decorated with functools.lru_cache, by name
+_CACHES = {}
+_LOCK = threading.Lock()
+
+def _record(name: str, elapsed: float) -> None:
+    with _LOCK:
+        timer = _TIMERS.setdefault(name, [0, 0.0, 0.0])
+        timer[0] += 1
+        timer[1] += elapsed
+        timer[2] = max(timer[2], elapsed)
+
+def instrumented(name: str = None):
+    """
+    Decorator counting the calls of a function and timing them, if the instrumentation is enabled.
+
+    Args:
+        name (str, optional): name of the timer. Defaults to the module and name of the function.
+    """
+    def decorator(function):
+        if not ENABLED:
+            return function
+        timer_name = name or f"{function.__module__.split('.')[-1]}.{function.__name__}"
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _record(timer_name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def timed(name: str):
+    """
+    Context manager timing a block of code (e.g. rendering or building a pdf), if the instrumentation is enabled.
+    """
+    if not ENABLED:
+        return contextlib.nullcontext()
+    return _timed(name)
+
+@contextlib.contextmanager
+def _timed(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start)
+
+def count(name: str, n: int = 1) -> None:
+    """
+    Increments a counter (e.g. figures skipped because they were already rendered), if the instrumentation is enabled.
+    """
+    if ENABLED:
+        with _LOCK:
+            _COUNTERS[name] = _COUNTERS.get(name, 0) + n
+
+def register_cache(name: str, function) -> None:
+    """
+    Registers a function decorated with functools.lru_cache, its hits and misses are read from cache_info().
+    """
+    _CACHES[name] = function
+
+def reset_instrumentation() -> None:
+    """
+    Clears the timers and counters (the caches keep their statistics until they are cleared).
+    """
+    with _LOCK:
+        _TIMERS.clear()
+        _COUNTERS.clear()
+
+def instrumentation_snapshot() -> dict:
+    """
+    Returns the statistics collected so far.
+
+    Returns:
+        dict: dictionary with the keys
+            - "enabled" (bool): True if the instrumentation is enabled,
+            - "timers" (dict): {name: {"calls", "total_seconds", "max_seconds"}},
+            - "counters" (dict): {name: count},
+            - "caches" (dict): {name: {"hits", "misses", "size"}}, available even if the instrumentation is disabled.
+    """
+    with _LOCK:
+        timers = {name: {"calls": calls, "total_seconds": total, "max_seconds": maximum}
+                  for name, (calls, total, maximum) in _TIMERS.items()}
+        counters = dict(_COUNTERS)
+    caches = {}
+    for name, function in _CACHES.items():
+        info = function.cache_info()
+        caches[name] = {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+    return {"enabled": ENABLED, "timers": timers, "counters": counters, "caches": caches}
+
+def prometheus_text() -> str:
+    """
+    Returns the statistics in the Prometheus text exposition format.
+    """
+    snapshot = instrumentation_snapshot()
+    metrics = [
+        ("hydroponics_function_calls_total", "counter", "Number of calls of the function.", "function",
+         {name: timer["calls"] for name, timer in snapshot["timers"].items()}),
+        ("hydroponics_function_seconds_total", "counter", "Total time spent in the function.", "function",
+         {name: timer["total_seconds"] for name, timer in snapshot["timers"].items()}),
+        ("hydroponics_function_seconds_max", "gauge", "Longest call of the function.", "function",
+         {name: timer["max_seconds"] for name, timer in snapshot["timers"].items()}),
+        ("hydroponics_events_total", "counter", "Number of events.", "event", snapshot["counters"]),
+        ("hydroponics_cache_hits_total", "counter", "Number of cache hits.", "cache",
+         {name: cache["hits"] for name, cache in snapshot["caches"].items()}),
+        ("hydroponics_cache_misses_total", "counter", "Number of cache misses.", "cache",
+         {name: cache["misses"] for name, cache in snapshot["caches"].items()}),
+    ]
+    lines = []
+    for metric, kind, description, label, values in metrics:
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, value in values.items():
+            lines.append(f'{metric}{{{label}="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
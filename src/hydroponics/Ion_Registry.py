@@ -0,0 +1,154 @@
+"""
+This file contains the registry of the ionic species of the package.
+
+The modules do not write the ions the same way: "NO3(-)" in dict_salts_trad, "NO3" in the pH module, "NH(4+)" and "NH4+",
+"Fe(3+)" and "Fe". Every spelling is resolved once to a species with an integer ID, its charge and its formula, so that
+the salts, the pH and the refill compare IDs instead of strings. Unknown names are added on first use, their charge being
+read from the name ("X(2+)", "X+", "X(-)", ...).
+"""
+
+#Imports
+import re
+import threading
+import numpy as np
+
+#Species by ID: canonical name, formula (without charge) and charge
+_NAMES = []
+_FORMULAS = []
+_CHARGES = []
+#ID of every known spelling
+_IDS = {}
+#Elemental composition by ID, computed on first use
+_COMPOSITIONS = {}
+_LOCK = threading.Lock()
+
+#Charge written at the end of a name: "(2+)", "(-)", "+" or "-" ("NH4+" is NH4 with a charge of 1)
+_CHARGE = re.compile(r"\((\d*)([+-])\)$|([+-])$")
+
+def _split_charge(name: str) -> tuple:
+    """
+    Splits a name into its formula and its charge, e.g. "SO4(2-)" -> ("SO4", -2), "K+" -> ("K", 1), "Mo" -> ("Mo", 0).
+    """
+    match = _CHARGE.search(name)
+    if match is None:
+        return name, 0
+    digits, sign = (match.group(1), match.group(2)) if match.group(2) else ("", match.group(3))
+    charge = int(digits) if digits else 1
+    return name[:match.start()], charge if sign == "+" else -charge
+
+def register_ion(name: str, charge: int = None, aliases: list = (), formula: str = None) -> int:
+    """
+    Adds a species to the registry, or new aliases to a known species.
+
+    Args:
+        name (str): canonical name of the species, e.g. "NO3(-)".
+        charge (int, optional): charge of the species. Defaults to the charge written in the name.
+        aliases (list, optional): other names of the species, e.g. ["NO3", "NO3-"].
+        formula (str, optional): formula of the species, without charge. Defaults to the name without its charge.
+
+    Returns:
+        int: the ID of the species.
+    """
+    with _LOCK:
+        if name in _IDS:
+            ion = _IDS[name]
+        else:
+            name_formula, name_charge = _split_charge(name)
+            ion = len(_NAMES)
+            _NAMES.append(name)
+            _FORMULAS.append(formula or name_formula)
+            _CHARGES.append(name_charge if charge is None else charge)
+            _IDS[name] = ion
+        for alias in aliases:
+            if _IDS.setdefault(alias, ion) != ion:
+                raise ValueError(f"{alias} is already a name of {_NAMES[_IDS[alias]]}.")
+    return ion
+
+def ion_id(name: str) -> int:
+    """
+    Returns the ID of a species from any of its names, unknown names are added to the registry.
+
+    Args:
+        name (str): name of the species, e.g. "NO3(-)", "NO3" or "NO3-".
+
+    Returns:
+        int: the ID of the species.
+    """
+    ion = _IDS.get(name)
+    return register_ion(name) if ion is None else ion
+
+def ion_ids(names: list) -> np.ndarray:
+    """
+    Returns the IDs of several species, in the order of names.
+    """
+    return np.array([ion_id(name) for name in names], dtype=int)
+
+def ion_name(ion: int) -> str:
+    """
+    Returns the canonical name of the species of an ID.
+    """
+    return _NAMES[ion]
+
+def canonical_ion(name: str) -> str:
+    """
+    Returns the canonical name of a species, e.g. "NH(4+)" -> "NH4+".
+    """
+    return _NAMES[ion_id(name)]
+
+def ion_formula(name: str) -> str:
+    """
+    Returns the formula of a species without its charge, e.g. "NH(4+)" -> "NH4", "EDTA" -> "C10H12N2O8".
+    """
+    return _FORMULAS[ion_id(name)]
+
+def ion_charge(name: str) -> int:
+    """
+    Returns the charge of a species, e.g. "SO4(2-)" -> -2.
+    """
+    return _CHARGES[ion_id(name)]
+
+def ion_composition(name: str) -> dict:
+    """
+    Returns the elemental composition of a species, e.g. "NH(4+)" -> {"N": 1, "H": 4}.
+    """
+    ion = ion_id(name)
+    if ion not in _COMPOSITIONS:
+        from .Basic_functions import parse_formula
+        _COMPOSITIONS[ion] = parse_formula(_FORMULAS[ion])
+    return dict(_COMPOSITIONS[ion])
+
+#Species of the package: canonical name (the spelling of dict_salts_trad, except NH4+ written "NH(4+)" in one salt), charge and other names
+for _name, _charge, _aliases in [
+    ("Ca(2+)", 2, ["Ca", "Ca2+"]),
+    ("Mg(2+)", 2, ["Mg", "Mg2+"]),
+    ("K+", 1, ["K", "K(+)"]),
+    ("Na+", 1, ["Na", "Na(+)"]),
+    ("NH4+", 1, ["NH(4+)", "NH4", "NH4(+)"]),
+    ("Mn(2+)", 2, ["Mn", "Mn2+"]),
+    ("Zn(2+)", 2, ["Zn", "Zn2+"]),
+    ("Cu(2+)", 2, ["Cu", "Cu2+"]),
+    ("Fe(3+)", 3, ["Fe", "Fe3+"]),
+    ("Fe(2+)", 2, ["Fe2+"]),
+    ("Al(3+)", 3, ["Al", "Al3+"]),
+    ("NO3(-)", -1, ["NO3", "NO3-"]),
+    ("SO4(2-)", -2, ["SO4"]),
+    ("HSO4(-)", -1, ["HSO4", "HSO4-"]),
+    ("H2PO4(-)", -1, ["H2PO4", "H2PO4-"]),
+    ("HPO4(2-)", -2, ["HPO4"]),
+    ("PO4(3-)", -3, ["PO4"]),
+    ("H2BO3(-)", -1, ["H2BO3", "H2BO3-"]),
+    ("HBO3(2-)", -2, ["HBO3"]),
+    ("BO3(3-)", -3, ["BO3"]),
+    ("Cl-", -1, ["Cl", "Cl(-)"]),
+    ("Br-", -1, ["Br", "Br(-)"]),
+    ("OH-", -1, ["OH", "OH(-)"]),
+    ("HCO3(-)", -1, ["HCO3", "HCO3-"]),
+    ("CO3(2-)", -2, ["CO3"]),
+    ("S(2-)", -2, []),
+    ("H+", 1, ["H", "H(+)"]),
+    ("B", 0, []),
+    ("Mo", 0, []),
+]:
+    register_ion(_name, _charge, _aliases)
+register_ion("EDTA", -4, ["EDTA(4-)"], formula="C10H12N2O8")
+del _name, _charge, _aliases
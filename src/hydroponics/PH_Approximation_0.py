@@ -1,134 +1,251 @@
-from sympy import symbols, Eq, solve
+import re
 import math
-import random
+import numpy as np
+from .Instrumentation import instrumented
+from .Ion_Registry import ion_id, ion_formula
 
+def _brent(f, a: float, b: float, tolerance: float = 1e-12, max_iterations: int = 100) -> float:
+    """
+    Finds the root of f in the bracket [a, b] with Brent's method (bisection, secant and inverse quadratic interpolation).
+
+    Args:
+        f (callable): function of one variable, f(a) and f(b) must have opposite signs.
+        a (float), b (float): bounds of the bracket.
+        tolerance (float): absolute tolerance on the root.
+        max_iterations (int): maximum number of iterations.
+
+    Returns:
+        float: the root of f.
+    """
+    fa, fb = f(a), f(b)
+    if fa*fb > 0:
+        raise ValueError("The root is not bracketed.")
+    if abs(fa) < abs(fb):
+        a, b, fa, fb = b, a, fb, fa
+    c, fc = a, fa
+    d = e = b - a
+    for _ in range(max_iterations):
+        if fb == 0 or abs(b - a) < tolerance:
+            return b
+        if fa != fc and fb != fc:
+            #Inverse quadratic interpolation
+            s = a*fb*fc/((fa-fb)*(fa-fc)) + b*fa*fc/((fb-fa)*(fb-fc)) + c*fa*fb/((fc-fa)*(fc-fb))
+        else:
+            #Secant
+            s = b - fb*(b-a)/(fb-fa)
+        if not ((3*a+b)/4 < s < b or b < s < (3*a+b)/4) or abs(s-b) >= abs(e)/2 or abs(e) < tolerance:
+            #Bisection
+            s = (a+b)/2
+            e = d = b - a
+        else:
+            e, d = d, s - b
+        fs = f(s)
+        c, fc = b, fb
+        if fa*fs < 0:
+            b, fb = s, fs
+        else:
+            a, fa = s, fs
+        if abs(fa) < abs(fb):
+            a, b, fa, fb = b, a, fb, fa
+    return b
+
+def _identify_species(species: list) -> tuple:
+    """
+    Identifies the metals and the acids of a list of species through the ion registry, so that every name of a species
+    (e.g. "Ca", "Ca(2+)" or "NO3", "NO3(-)") is recognised.
+
+    Returns:
+        tuple: (metals, acids) with metals = {compound: (charge, Ksp of the hydroxide)} and
+            acids = {compound: (highest charge of the acid, pKa values)}
+    """
+    metal_ids = {ion_id(metal): (compound_charge[metal], Ksp_values[metal]) for metal in Ksp_values}
+    table = _speciation_table()
+    metals, acids = {}, {}
+    for compound in species:
+        form = table.get(ion_formula(compound))
+        if ion_id(compound) in metal_ids:
+            metals[compound] = metal_ids[ion_id(compound)]
+        elif form is not None:
+            acid, degree, pKa, charge = form
+            acids[compound] = (charge + degree, pKa)
+    return metals, acids
+
+def _charge_balance(concentration_of_ions_in_solution: dict, temperature: float):
+    """
+    Reduces the equilibria of the solution to the charge balance, a single increasing function of log10([H+]).
+
+    Returns:
+        callable: f(log10([H+])) = sum of the positive charges - sum of the negative charges [mol/L]
+    """
+    if temperature not in Value_of_Ionisation_Constant:
+        raise ValueError(f"The ionisation constant of water is not known at {temperature} °C.")
+    Kw = Value_of_Ionisation_Constant[temperature]
+    metal_species, acid_species = _identify_species(list(concentration_of_ions_in_solution))
+    
+    #Metals: the dissolved part is limited by the precipitation of the hydroxide M(OH)z
+    metals = []
+    #Acids: the total concentration is distributed over the states of deprotonation
+    acids = []
+    for compound, compound_concentration in concentration_of_ions_in_solution.items():
+        #If the concentration of the compound is 0, then the compound is not considered in the calculations
+        if float(compound_concentration) == 0:
+            continue
+        if compound in metal_species:
+            metals.append((float(compound_concentration), *metal_species[compound]))
+        elif compound in acid_species:
+            highest_charge, pKa = acid_species[compound]
+            acids.append((float(compound_concentration), highest_charge, [-value*math.log(10) for value in pKa]))
+        #Other compounds are spectators
+    
+    def charge_balance(log_H: float) -> float:
+        H = 10**log_H
+        OH = Kw/H
+        ln_H = log_H*math.log(10)
+        charge = H - OH
+        for concentration, z, Ksp in metals:
+            charge += z*min(concentration, Ksp/OH**z)
+        for concentration, highest_charge, log_Ka in acids:
+            #log of the relative abundance of each state s: sum(log Ka_j, j<s) - s*log[H+]
+            log_beta = [0.0]
+            for s, log_Ka_s in enumerate(log_Ka):
+                log_beta.append(log_beta[-1] + log_Ka_s - ln_H)
+            largest = max(log_beta)
+            beta = [math.exp(value - largest) for value in log_beta]
+            mean_charge = sum((highest_charge - s)*beta_s for s, beta_s in enumerate(beta))/sum(beta)
+            charge += concentration*mean_charge
+        return charge
+    return charge_balance
+
+@instrumented()
 def pH_approximation (concentration_of_ions_in_solution:dict, temperature:float)->float:
     """
     This function calculates the pH of a solution given the concentrations of ions in the solution and the temperature of the solution.
+    The charge balance of the solution is written as a single increasing function of [H+] that is solved numerically (Brent's method):
+    - metals of Ksp_values carry a charge compound_charge, their dissolved concentration is limited by the Ksp of their hydroxide,
+    - acids and their deprotonated forms (see find_acid) are distributed over their states of deprotonation with the pKa_values,
+    - the other compounds are spectators.
+
+    Parameters:
+    concentration_of_ions_in_solution (dict): A dictionary containing the ions(str) as keys and their concentrations(float) [mol/L] in the solution as values.
+    temperature (float): The temperature of the solution in degrees Celsius, must be a key of Value_of_Ionisation_Constant.
+
+    Returns:
+    pH (float): The pH of the solution.
+    """
+    charge_balance = _charge_balance(concentration_of_ions_in_solution, temperature)
+    #The charge balance increases with [H+], widen the bracket until it contains the root
+    low, high = -16.0, 2.0
+    while charge_balance(low) > 0:
+        low -= 4
+    while charge_balance(high) < 0:
+        high += 4
+    log_H = _brent(charge_balance, low, high)
+    return -log_H
+
+
+def _charge_balance_arrays(species: list, temperature: float) -> tuple:
+    """
+    Compiles the equilibria of a list of species into arrays used by pH_approximation_batch.
+
+    Returns:
+        tuple: (Kw, metals, acids) with
+            metals = (column indices, charges, Ksp values),
+            acids = (column indices, highest charges, log(Ka) matrix [acids x states-1], -inf for missing states)
+    """
+    if temperature not in Value_of_Ionisation_Constant:
+        raise ValueError(f"The ionisation constant of water is not known at {temperature} °C.")
+    metal_species, acid_species = _identify_species(species)
+    metal_columns = [j for j, compound in enumerate(species) if compound in metal_species]
+    acid_columns = [j for j, compound in enumerate(species) if compound in acid_species]
+    metals = (np.array(metal_columns, dtype=int),
+              np.array([metal_species[species[j]][0] for j in metal_columns], dtype=float),
+              np.array([metal_species[species[j]][1] for j in metal_columns], dtype=float))
+    nb_pKa = max([len(acid_species[species[j]][1]) for j in acid_columns], default=0)
+    log_Ka = np.full((len(acid_columns), nb_pKa), -np.inf)
+    for i, j in enumerate(acid_columns):
+        pKa = acid_species[species[j]][1]
+        log_Ka[i, :len(pKa)] = -np.array(pKa)*np.log(10)
+    acids = (np.array(acid_columns, dtype=int),
+             np.array([acid_species[species[j]][0] for j in acid_columns], dtype=float),
+             log_Ka)
+    return Value_of_Ionisation_Constant[temperature], metals, acids
 
+@instrumented()
+def pH_approximation_batch(concentrations: np.ndarray, species: list, temperature: float, initial_pH=None) -> np.ndarray:
+    """
+    Calculates the pH of many solutions at once, e.g. the days of a growth simulation.
+    Same model as pH_approximation: the charge balance of every row is solved with a Newton iteration
+    on log10([H+]), safeguarded by bisection, vectorized over the rows with NumPy.
+    
     Parameters:
-    concentration_of_ions_in_solution (dict): A dictionary containing the ions(str) as keys and their concentrations(float) in the solution as values.
-    temperature (float): The temperature of the solution in degrees Celsius.
+    concentrations (np.ndarray): 2-D array [solutions x species] of concentrations [mol/L].
+    species (list): names of the species of the columns, as in pH_approximation.
+    temperature (float): The temperature of the solutions in degrees Celsius.
+    initial_pH (float or np.ndarray, optional): starting pH of the iterations, one for every row or one per row.
+        By default the first row is solved with pH_approximation and all the rows start from its pH, not from the pH of
+        the previous row: the rows are iterated together. This is a good start when the concentrations change slowly
+        from one row to the next; the bisection brackets keep every row converging otherwise.
 
     Returns:
-    pH (float): The pH of the solution. If the solution is unsolvable, the function returns a random value following a normal distribution
-    around mu with a standard deviation sigma. 
+    np.ndarray: the pH of each row.
     """
-    try:
-        #Using find_acid so as to determine pKa values associated to some ions in the solution 
-        Degree_of_deprotonation, pKa_identified_ions,highest_existing_charge_of_identified_ion=find_acid(concentration_of_ions_in_solution, pKa_values)
-        #setting index for compounds possesing pKa values
-        i=0
-        #setting index for compounds possesing Ksp values (metals)
-        l=0
-        #setting variable of the concentration of protons in solution
-        H_plus_concentration=symbols("H_plus_concentration")
-        #setting variable of the concentration of OH- in solution 
-        OH_minus_concentration=symbols("OH_minus_concentration")
-        
-        # Defines system of equations
-        equations = []
-        
-        # Initialize a list to accumulate variables for charge balance calculations 
-        accumulated_variables_for_charge_balance = []
-        # Assigns the value of the ionization constant of water (Kw) at a specific temperature
-        Kw=Value_of_Ionisation_Constant[temperature]
-        # Defines the equation for the ionization constant of water
-        Kw_equation=Eq(H_plus_concentration*OH_minus_concentration,Kw)
-        equations.append(Kw_equation)
-        #Adding OH_minus and H_plus to charge balance
-        accumulated_variables_for_charge_balance.append(H_plus_concentration-OH_minus_concentration)
-        #Initialise a list for final proton concentration
-        accumulated_variables_for_final_proton_concentration=[]
-        #Initialise a variable for final OH-
-        accumulated_variables_for_final_OH_concentration=[]
-        #Initial concentration of protons
-        H_plus_zero=10**(-7)
-        #Initial concentration of OH-
-        OH_minus_zero=10**(-7)
-        #Adding final concentration variables
-        accumulated_variables_for_final_OH_concentration.append(OH_minus_concentration)
-        accumulated_variables_for_final_proton_concentration.append(H_plus_concentration)
-        for compound, compound_concentration in concentration_of_ions_in_solution.items():
-            #If the concentration of the compound is 0, then the compound is not considered in the calculations
-            if float(compound_concentration) == 0:
-                continue
-            """
-            Below, it is checked as to whether or not the compound has a solubility product constant or an acid dissociation constant. The former allows one to define the impact that metal ions have on the pH of the solution
-            One can see Ksp having an impact on the pH with the example that follows. We have an initial salt we place in a solution, i.e, CaSO4, which then dissociates into Ca^2+ and SO4^2-. 
-            There is then a Ksp constant that depends on the concentration of Ca^2+, OH^-1 and Ca(OH)2 and a Ka value that depends on the concentration of SO4^2-, HSO4^1- and H2SO4 as well as H+
-            The Ksp constant has an impact on the concentration of OH^-1 which in itself impact the pH of the solution.
-            """
-            if compound in Ksp_values:
-                #Defines variables for the concentrations of the metal in a dissociated state or not, i.e, Ca(OH)^2- or Ca^2+
-                exec(f"dissociated_metal_{l}_concentration]=symbols(dissociated_metal_{l}_concentration)")
-                exec(f"undissociated_metal_compound_{l}_concentration=symbols(undissociated_metal_compound_{l}_concentration)")
-                #Equation of dissociation equilibrium
-                exec(f"equation_Ksp = Eq((dissociated_metal_compound_{l}_concentration*OH_minus_concentration**(compound_charge[compound])), Ksp_values[compound])")
-                equations.append(equation_Ksp)
-                # Accumulating variables for charge balance. 
-                accumulated_variables_for_charge_balance.append(compound_charge[compound]*f'dissociated_metal_{l}_concentration')
-                #Mass equation of metal/metal compound
-                exec(f"mass_balance_metal = Eq(dissociated_metal_{l}_concentration + undissociated_metal_{l}_concentration, compound_concentration)")
-                equations.append(mass_balance_metal)
-                exec(f"accumulated_variables_for_final_OH_concentration.append(-compound_charge[compound]*undissociated_metal_compound_{l}_concentration)")
-                l+=1
-            else: 
-                #Defines the constant that is the initial concentration of the compound 
-                globals()[f'initial_compound_concentration_{i}']=compound_concentration 
-                #Initialize a variable to accumulate the variables of the concentrations into one equation of mass balance
-                accumulated_variables_for_mass_balance=[]
-                #Determines the number of states a compound is in whose concentrations define one of the known Ka values of the compound, there could be more states in reality, but they are negligeable. 
-                number_of_states_of_dissociation=len(pKa_identified_ions[compound])+1
-                
-                for s in range (number_of_states_of_dissociation): 
-                    #derives the Ka_th value of a compound
-                    if s!=number_of_states_of_dissociation-1:
-                        exec(f'Ka_{s}_value_of_compound_{i}=float(10**(-pKa_identified_ions[compound][s]))')
-                    #This line below generates symbolic variables representing the concentrations of 
-                    #different forms of a compound, where each variable corresponds to a state of dissociation "s" of compound "i" .
-                    exec(f'A_{s}_{i}_concentration = symbols(f"A_{s}_{i}_concentration")')
-                    # Accumulating variables for charge balance.
-                    exec(f'accumulated_variables_for_charge_balance.append((highest_existing_charge_of_identified_ion[compound]-s)*A_{s}_{i}_concentration)')
-                    #Accumulating variables for mass balance 
-                    exec(f'accumulated_variables_for_mass_balance.append(A_{s}_{i}_concentration)')
-                    #Accumulating variables for final proton concentration
-                    if s<Degree_of_deprotonation[compound]:
-                        exec(f'accumulated_variables_for_final_proton_concentration.append(A_{s}_{i}_concentration)')
-                    if s>Degree_of_deprotonation[compound]:
-                        exec(f'accumulated_variables_for_final_proton_concentration.append(-1*A_{s}_{i}_concentration)')
-                for s in range(number_of_states_of_dissociation):
-                    if s!=number_of_states_of_dissociation-1:
-                        exec(f'equation_Ka_{s}_{i} = Eq((H_plus_concentration*A_{s+1}_{i}_concentration)/A_{s}_{i}_concentration, Ka_{s}_value_of_compound_{i})')
-                        exec(f'equations.append(equation_Ka_{s}_{i})')
-                mass_equation_i=Eq(sum(accumulated_variables_for_mass_balance),compound_concentration)
-                equations.append(mass_equation_i)
-                i+=1
-        #Setting up the charge balance equation
-        Charge_Balance_equation= Eq(sum(accumulated_variables_for_charge_balance), 0)
-        #Adding charge balance equation to the list of equations
-        equations.append(Charge_Balance_equation)
-        #Setting up the mass balance equation for protons 
-        proton_concentration_mass_balance=Eq(sum(accumulated_variables_for_final_proton_concentration),H_plus_zero)
-        #Adding mass balance equation for protons to the list of equations
-        equations.append(proton_concentration_mass_balance)
-        #Setting up the mass balance equation for OH- when there is at least one metal ion in the solution, otherwise, the equation is not needed
-        if len(accumulated_variables_for_final_OH_concentration)>1:
-            OH_concentration_mass_balance=Eq(sum(accumulated_variables_for_final_OH_concentration),OH_minus_zero)
-            equations.append(OH_concentration_mass_balance)
-        #Solving the system of equations
-        solution = solve(equations, (H_plus_concentration, OH_minus_concentration))
-        #If the solution is empty, the pH is set to be a value randomly generated around 6.5 following a normal distribution. This is done to use the function to generate the graph of pH no matter what. 
-    except:
-        solution = []
-    if (len(solution))==0:
-        mu = 6.5  # mean
-        sigma = 0.2  # standard deviation
-        random_pH_value = round(random.gauss(mu, sigma),4)
-
-        return random_pH_value
-    pH=-math.log10(solution[0][0])
-    return pH
+    concentrations = np.atleast_2d(np.asarray(concentrations, dtype=float))
+    if concentrations.shape[1] != len(species):
+        raise ValueError("The number of columns must match the number of species.")
+    Kw, (metal_columns, z, Ksp), (acid_columns, highest_charge, log_Ka) = _charge_balance_arrays(species, temperature)
+    metal_concentrations = concentrations[:, metal_columns]
+    acid_concentrations = concentrations[:, acid_columns]
+    #Cumulated log(Ka) of the states of deprotonation s = 0, 1, ..., and their charges
+    cumulated_log_Ka = np.concatenate([np.zeros((len(acid_columns), 1)), np.cumsum(log_Ka, axis=1)], axis=1)
+    states = np.arange(cumulated_log_Ka.shape[1])
+    state_charges = highest_charge[:, None] - states[None, :]
+    ln10 = np.log(10)
+    
+    def charge_balance(log_H: np.ndarray) -> tuple:
+        #Returns the charge balance and its derivative with respect to log10([H+])
+        H = 10**log_H
+        OH = Kw/H
+        charge = H - OH
+        derivative = ln10*(H + OH)
+        dissolved = Ksp[None, :]/OH[:, None]**z[None, :]
+        limited = dissolved < metal_concentrations
+        charge = charge + (z*np.where(limited, dissolved, metal_concentrations)).sum(axis=1)
+        derivative = derivative + ln10*(z**2*np.where(limited, dissolved, 0)).sum(axis=1)
+        #Relative abundance of each state: sum(log Ka_j, j<s) - s*ln[H+]
+        log_beta = cumulated_log_Ka[None, :, :] - states[None, None, :]*(ln10*log_H)[:, None, None]
+        beta = np.exp(log_beta - log_beta.max(axis=2, keepdims=True))
+        alpha = beta/beta.sum(axis=2, keepdims=True)
+        mean_state = (alpha*states).sum(axis=2)
+        variance_state = (alpha*states**2).sum(axis=2) - mean_state**2
+        charge = charge + (acid_concentrations*(alpha*state_charges[None, :, :]).sum(axis=2)).sum(axis=1)
+        derivative = derivative + ln10*(acid_concentrations*variance_state).sum(axis=1)
+        return charge, derivative
+    
+    rows = concentrations.shape[0]
+    low, high = np.full(rows, -16.0), np.full(rows, 2.0)
+    while (above := charge_balance(low)[0] > 0).any():
+        low[above] -= 4
+    while (below := charge_balance(high)[0] < 0).any():
+        high[below] += 4
+    if initial_pH is None:
+        #Every row starts from the pH of the first one
+        initial_pH = pH_approximation(dict(zip(species, concentrations[0])), temperature) if rows else 7.0
+    log_H = np.clip(-np.broadcast_to(np.asarray(initial_pH, dtype=float), (rows,)), low, high)
+    
+    for _ in range(100):
+        charge, derivative = charge_balance(log_H)
+        #Shrink the brackets, the charge balance increases with [H+]
+        low = np.where(charge < 0, log_H, low)
+        high = np.where(charge > 0, log_H, high)
+        step = np.where(derivative > 0, charge/np.where(derivative > 0, derivative, 1), np.inf)
+        new_log_H = log_H - step
+        outside = ~((new_log_H > low) & (new_log_H < high))
+        new_log_H = np.where(outside, (low + high)/2, new_log_H)
+        converged = np.abs(new_log_H - log_H) < 1e-12
+        log_H = new_log_H
+        if converged.all() or (high - low < 1e-12).all():
+            break
+    return -log_H
 
 
 #Dictionary of Ksp_values of metal hydroxides associated to ions 
@@ -192,11 +309,88 @@ highest_existing_charge_of_compounds={
     "HCl" : 0,
     "NH4" : 1}
 
+#Name of highest_existing_charge_of_compounds not hidden by the arguments of find_acid
+_HIGHEST_CHARGES = highest_existing_charge_of_compounds
+#Speciation table of pKa_values and highest_existing_charge_of_compounds, built on first use and again by register_acid
+_SPECIATION_TABLE = None
+#Acid written with its protons first ("H3PO4", "HCl") or last ("NH4")
+_LEADING_PROTONS = re.compile(r"^H(\d*)(.+)$")
+_TRAILING_PROTONS = re.compile(r"^(.+?)H(\d*)$")
+
+def _speciation_forms(acid: str, nb_pKa: int) -> list:
+    """
+    Returns the names of the states of deprotonation of an acid, from the acid itself to its most deprotonated form,
+    e.g. "H3PO4" -> ["H3PO4", "H2PO4", "HPO4", "PO4"], "NH4" -> ["NH4", "NH3"].
+    """
+    match = _LEADING_PROTONS.match(acid)
+    if match:
+        protons, rest = int(match.group(1) or 1), match.group(2)
+        write = lambda n: ("H" if n == 1 else f"H{n}" if n > 1 else "") + rest
+    else:
+        match = _TRAILING_PROTONS.match(acid)
+        if match is None:
+            return [acid]
+        rest, protons = match.group(1), int(match.group(2) or 1)
+        write = lambda n: rest + ("H" if n == 1 else f"H{n}" if n > 1 else "")
+    return [write(protons - degree) for degree in range(min(protons, nb_pKa) + 1)]
+
+def _build_speciation_table(acids_pKa: dict, highest_existing_charge_of_compounds: dict) -> dict:
+    """
+    Builds the map from every state of deprotonation of the acids to (parent acid, degree of deprotonation, pKa values, charge).
+    Acids without a highest charge are left out.
+    """
+    table = {}
+    for acid, pKa in acids_pKa.items():
+        if acid not in highest_existing_charge_of_compounds:
+            continue
+        for degree, form in enumerate(_speciation_forms(acid, len(pKa))):
+            table.setdefault(form, (acid, degree, pKa, highest_existing_charge_of_compounds[acid] - degree))
+    return table
+
+def _speciation_table() -> dict:
+    """
+    Returns the speciation table of pKa_values and highest_existing_charge_of_compounds (see register_acid).
+    """
+    global _SPECIATION_TABLE
+    if _SPECIATION_TABLE is None:
+        _SPECIATION_TABLE = _build_speciation_table(pKa_values, highest_existing_charge_of_compounds)
+    return _SPECIATION_TABLE
+
+def speciation(compound: str):
+    """
+    Returns the acid a compound is a state of deprotonation of, e.g. "HPO4(2-)" -> ("H3PO4", 2, [2.12, 7.21, 12.32], -2).
+
+    Parameters:
+    compound (str): name of the compound, any name of the ion registry.
+
+    Returns:
+    tuple: (parent acid, degree of deprotonation, pKa values of the acid, charge of the compound), None if the compound is not an acid.
+    """
+    return _speciation_table().get(ion_formula(compound))
+
+def register_acid(acid: str, pKa: list, highest_charge: int = 0) -> None:
+    """
+    Adds an acid to pKa_values and highest_existing_charge_of_compounds, its states of deprotonation are then
+    recognised by find_acid, speciation and the pH approximations. Acids must be added this way rather than by
+    editing the dictionaries, which are only read again here.
+
+    Parameters:
+    acid (str): the acid with all its protons, e.g. "H2CO3" or "NH4".
+    pKa (list): its pKa values, one per proton.
+    highest_charge (int): its charge, e.g. 1 for NH4. Defaults to 0.
+    """
+    global _SPECIATION_TABLE
+    pKa_values[acid] = list(pKa)
+    highest_existing_charge_of_compounds[acid] = highest_charge
+    _SPECIATION_TABLE = _build_speciation_table(pKa_values, highest_existing_charge_of_compounds)
+
 def find_acid(ions_concentration:dict, acids_pKa:dict,highest_existing_charge_of_compounds:dict)->tuple:
     """
     Identify acids or their deprotonated forms, and return two dictionaries. One where the keys are the identified ions/acids 
     and attribute to them the pKas of the acid they're associated, the second with the same keys but values being the number of 
     protons the acid would have to lost to reach the form of the ion. 
+    The states of deprotonation of the acids of the module are computed once (see register_acid), those of other
+    dictionaries on each call; identifying an ion is then a dictionary lookup.
 
     Parameters:
     ions_concentration (dict): A dictionary with ion names as keys and their concentrations as values.
@@ -209,60 +403,25 @@ def find_acid(ions_concentration:dict, acids_pKa:dict,highest_existing_charge_of
     2.Dictionary where ions are the key and the values are the pkas of the acid
     3.Dictionary where ions are the key and the values are the highest charge of the compound when it is undissociated
     """
+    if acids_pKa is pKa_values and highest_existing_charge_of_compounds is _HIGHEST_CHARGES:
+        table = _speciation_table()
+    else:
+        table = _build_speciation_table(acids_pKa, highest_existing_charge_of_compounds)
     #Create  empty dictionary of number of protons lost by the identified ion/acid
     Degree_of_deprotonation={}
     #Creaty empty dictionary of ions with the corresponding pKa values of the acid they are associated to
     pKa_identified_ions={}
     #Create empty dictionary of the highest known charge of the compound when it is undissociated
     highest_existing_charge_of_identified_ion={}
-    #Creates list of acids from pKa dictionary 
-    acids = list(acids_pKa.keys())
-    for ion, concentration in ions_concentration.items():
-        #Value of constant set, which would be zero at end of loop if the ion wasn't identified and one if it was
-        #This is used in order to print a message if the ion was not identified if one wants to debug
-        i=0
-        #Check if the solute is an acid that is not deprotonated
-        for acid in acids:
-            if ion==acid:
-                #print(f"The solute:{ion}, was identified as being an acid in the list of pKa values")
-                i=1
-                Degree_of_deprotonation[ion]=0
-                pKa_identified_ions[ion]=acids_pKa[acid]
-                highest_existing_charge_of_identified_ion[ion]=highest_existing_charge_of_compounds[acid]
-                continue
-            else:
-                # Check if the ion/solute is a deprotonated form of any acid
-                    if len(ion)!=len(acid):
-                        if len(ion)==len(acid)-1:
-                            if acid[0] + acid[2:]==ion:
-                                #print (f"Ion:{ion} was identified as being the deprotonated form of:", acid)
-                                pKa_identified_ions[ion]=acids_pKa[acid]
-                                Degree_of_deprotonation[ion]=int(acid[1])-1
-                                highest_existing_charge_of_identified_ion[ion]=highest_existing_charge_of_compounds[acid]
-                                i=1
-                            else:
-                                continue
-                        elif len(ion)==len(acid)-2:
-                            if ion==acid[2:]:
-                                #print (f"Ion:{ion} was identified as being the deprotonated form of:", acid)
-                                pKa_identified_ions[ion]=acids_pKa[acid]
-                                Degree_of_deprotonation[ion]=int(acid[1])
-                                highest_existing_charge_of_identified_ion[ion]=highest_existing_charge_of_compounds[acid]
-                                i=1
-                            else:
-                                continue
-                    else:
-                        if acid[0]+acid[2:]==ion[0]+ion[2:]:
-                            i=1
-                            #print(f"Ion:{ion} was identified as being the deprotonated form of:", acid)
-                            Degree_of_deprotonation[ion]=int(acid[1])-int(ion[1])
-                            pKa_identified_ions[ion]=acids_pKa[acid]
-                            highest_existing_charge_of_identified_ion[ion]=highest_existing_charge_of_compounds[acid]
-
-
-        if i!=1: 
-            #print("The ion or acid:", ion ,"could not be identified ")
+    for ion in ions_concentration:
+        form = table.get(ion_formula(ion))
+        if form is None:
+            #The ion or acid could not be identified
             continue
+        acid, degree, pKa, charge = form
+        Degree_of_deprotonation[ion]=degree
+        pKa_identified_ions[ion]=pKa
+        highest_existing_charge_of_identified_ion[ion]=charge+degree
     return Degree_of_deprotonation, pKa_identified_ions, highest_existing_charge_of_identified_ion
 
 # Test values for the function
@@ -1,22 +1,87 @@
 
-import time
+import asyncio
+import inspect
+import numpy as np
+from .Instrumentation import instrumented
+from .Basic_functions import get_molar_masses, salt_catalog, _nnls, _row_weights
 
-""""
-Optional: Implement the following function that will be called by the main function that is provided below.
 
-def Concentration_Checker(frequency:float)->None:
-    print("Monitoring of Concentration started at:", time.time())
+class SimulatedSensor:
+    """
+    Simulated sensor backend for Concentration_Checker: each reservoir loses a fixed quantity of every ion
+    between two readings, and the dosing commands are added back to the reservoir.
+
+    Parameters:
+        concentrations (dict[str, dict[str, float]]): Initial concentration of the ions of each reservoir.
+        uptake (dict[str, float]): Concentration of each ion taken up by the plants between two readings.
+        latency (float): Time taken by a reading [s].
+    """
+    def __init__(self, concentrations: dict[str, dict[str, float]], uptake: dict[str, float], latency: float = 0.0):
+        self.concentrations = {reservoir: dict(ions) for reservoir, ions in concentrations.items()}
+        self.uptake = uptake
+        self.latency = latency
+        self.commands = []
+
+    async def read(self, reservoir: str) -> dict[str, float]:
+        await asyncio.sleep(self.latency)
+        ions = self.concentrations[reservoir]
+        for ion, quantity in self.uptake.items():
+            if ion in ions:
+                ions[ion] = max(ions[ion] - quantity, 0.0)
+        return dict(ions)
+
+    async def dose(self, reservoir: str, quantities: dict[str, float]) -> None:
+        self.commands.append((reservoir, quantities))
+        for ion, quantity in quantities.items():
+            self.concentrations[reservoir][ion] += quantity
 
-# Converts frequency in number of times per day to per second (e.g., 2 times per second)
-frequency =frequency/(24*60*60) # calls per second
 
-# Calculate the time interval between function calls
-time_interval = 1 / frequency # seconds
+async def Concentration_Checker(
+    optimal_ion_concentrations: dict[str, dict[str, float]],
+    read_sensor,
+    dose,
+    frequency: float,
+    *args: float,
+    cycles: int = None,
+    max_concurrent_readings: int = 100
+) -> None:
+    """
+    Monitors many reservoirs concurrently: each reservoir is read frequency times per day and a dosing command is
+    emitted with the quantities computed by Refill_of_container when ions are missing.
+
+    Parameters:
+        optimal_ion_concentrations (dict[str, dict[str, float]]): The optimal concentration of ions of each reservoir.
+        read_sensor (callable): Coroutine function returning the concentration of ions of a reservoir, e.g. SimulatedSensor.read.
+        dose (callable): Function or coroutine function receiving a reservoir and the quantities of ions to add, e.g. SimulatedSensor.dose.
+        frequency (float): Number of readings per day.
+        *args (float): Acceptable maximum percentage deviations from the optimal concentration (see Refill_of_container).
+        cycles (int): Number of readings of each reservoir before stopping. Defaults to None (run forever).
+        max_concurrent_readings (int): Maximum number of sensors read at the same time.
+    """
+    # Converts frequency in number of times per day to the time interval between two readings in seconds
+    time_interval = 24*60*60/frequency
+    readings = asyncio.Semaphore(max_concurrent_readings)
+
+    async def monitor(reservoir: str, optimal: dict[str, float]) -> None:
+        loop = asyncio.get_running_loop()
+        next_reading = loop.time()
+        cycle = 0
+        while cycles is None or cycle < cycles:
+            async with readings:
+                concentration_of_ions = await read_sensor(reservoir)
+            quantities = Refill_of_container(concentration_of_ions, optimal, *args)
+            # Ions can only be added to the reservoir
+            quantities = {ion: quantity for ion, quantity in quantities.items() if quantity > 0}
+            if quantities:
+                command = dose(reservoir, quantities)
+                if inspect.isawaitable(command):
+                    await command
+            cycle += 1
+            # The readings are scheduled on a fixed grid so that slow readings do not shift the next ones
+            next_reading += time_interval
+            await asyncio.sleep(max(next_reading - loop.time(), 0))
 
-while True:
-    Refill_of_container(concentration_of_ions, acceptable_maximum_percentage_deviation_from_optimal, optimal_ion_concentrations)
-    time.sleep(time_interval)    
-"""
+    await asyncio.gather(*(monitor(reservoir, optimal) for reservoir, optimal in optimal_ion_concentrations.items()))
 
 
 def Refill_of_container(
@@ -34,17 +99,104 @@ def Refill_of_container(
     Parameters:
         concentration_of_ions (dict[str, float]): A dictionary containing the concentration of ions in the solution.
         optimal_ion_concentrations (dict[str, float]): A dictionary containing the optimal concentration of ions in the solution.
-        *args (float): A list of acceptable maximum percentage deviations from the optimal concentration of ions in the solution.
+        *args (float): A list of acceptable maximum percentage deviations from the optimal concentration of ions in the solution,
+            either one for every ion or one per ion in the order of concentration_of_ions.
 
     Returns:
         dict[str, float]: A dictionary containing the ions and the quantities to add to the solution.
     """
+    if len(args) not in (0, 1, len(concentration_of_ions)):
+        raise ValueError("Give either one deviation for every ion or one deviation per ion.")
+    deviations = args*len(concentration_of_ions) if len(args) == 1 else args
     # This part calculates the quantities of ions to add to the solution
     Ion_quantities_to_add={}
-    for ion, concentration in concentration_of_ions.items():
+    for i, (ion, concentration) in enumerate(concentration_of_ions.items()):
             concentration_to_add=optimal_ion_concentrations[ion]-concentration_of_ions[ion]
+            if deviations:
+                # Skips the ions above the optimal concentration or within the acceptable deviation
+                if concentration_to_add <= optimal_ion_concentrations[ion]*deviations[i]/100:
+                    continue
             Ion_quantities_to_add[ion]= concentration_to_add
     return Ion_quantities_to_add
 
-            
-    
\ No newline at end of file
+
+# Refill plans of plan_refill, by forbidden ions, for the salt catalog _REFILL_CATALOG
+_REFILL_PLANS = {}
+_REFILL_CATALOG = None
+
+def _refill_plan(forbidden_ions: frozenset) -> dict:
+    """
+    Builds, once for each set of forbidden ions, the stoichiometry matrix [ions x salts] of the allowed soluble salts,
+    with a row for every ion of the catalog.
+    """
+    global _REFILL_CATALOG
+    catalog = salt_catalog()
+    if catalog is not _REFILL_CATALOG:
+        # A salt was registered, the plans are built again
+        _REFILL_PLANS.clear()
+        _REFILL_CATALOG = catalog
+    if forbidden_ions not in _REFILL_PLANS:
+        selected = np.flatnonzero(catalog.salts_with(catalog.ions, forbidden_ions) & np.isfinite(catalog.log_Ksp))
+        _REFILL_PLANS[forbidden_ions] = {"salts": [catalog.salts[i] for i in selected],
+                                         "stoichiometry": catalog.stoichiometry[selected].T,
+                                         "salt_masses": get_molar_masses([catalog.salts[i] for i in selected]),
+                                         "ion_masses": catalog.ion_masses(range(len(catalog.ions))),
+                                         "active": None, "rows": None}
+    return _REFILL_PLANS[forbidden_ions]
+
+@instrumented()
+def plan_refill(ion_deficits: dict[str, float], forbidden_ions: list, volume: float) -> dict[str, float]:
+    """
+    Converts ion deficits, e.g. from Refill_of_container, into masses of salt to add, as make_solution(backend="numeric").
+    
+    The stoichiometry of the allowed salts is built once for each set of forbidden ions, together with the salts used
+    by the last refill. Each row is divided by its target, so that the relative error of every ion is minimized and a
+    micronutrient deficit is not sacrificed to the macronutrients; ions without a deficit are asked to stay at 0.
+    As the weights change with the deficits, the factorization of the last salts cannot be reused: a refill that uses
+    the same salts is a least squares problem on these salts and the ions they bring only, otherwise the non-negative
+    least squares problem is solved and the new salts are cached.
+
+    Parameters:
+        ion_deficits (dict[str, float]): Concentration of ions to add [g/L]. Ions with a deficit <= 0 are ignored.
+        forbidden_ions (list): Ions that cannot be added to the solution.
+        volume (float): Volume of the solution [L].
+
+    Returns:
+        dict[str, float]: A dictionary containing the salts and the mass to add [g].
+    """
+    if volume <= 0:
+        raise ValueError("Volume must be positive.")
+    deficits = {ion: deficit for ion, deficit in ion_deficits.items() if deficit > 0}
+    if set(deficits).intersection(forbidden_ions):
+        raise ValueError(f"Forbidden ions are required in the solution: {set(deficits).intersection(forbidden_ions)}")
+    if not deficits:
+        return {}
+    catalog = salt_catalog()
+    plan = _refill_plan(frozenset(forbidden_ions))
+    A = plan["stoichiometry"]
+    columns = [catalog.column(ion) for ion in deficits]
+    missing_ions = [ion for ion, column in zip(deficits, columns) if column is None or not A[column].any()]
+    if missing_ions:
+        raise ValueError(f"No refill found: no allowed soluble salt provides {missing_ions}. Please check the ions and the forbidden ions.")
+    wanted = np.zeros(len(A))
+    for ion, column in zip(deficits, columns):
+        wanted[column] += deficits[ion]/plan["ion_masses"][column]*volume
+    weights = _row_weights(wanted)
+    A, wanted = weights[:, None]*A, weights*wanted
+    
+    moles = None
+    if plan["active"] is not None:
+        active, rows = plan["active"], plan["rows"]
+        moles = np.zeros(A.shape[1])
+        # The other rows do not depend on the cached salts
+        moles[active] = np.linalg.lstsq(A[np.ix_(rows, active)], wanted[rows], rcond=None)[0]
+        # The cached salts give the optimum if all amounts are positive and no other salt would reduce the error
+        gradient = A.T @ (wanted - A @ moles)
+        tol = 1e-10*max(np.abs(wanted).max(), 1e-300)
+        if (moles[active] <= 0).any() or (gradient[~active] > tol).any():
+            moles = None
+    if moles is None:
+        moles = _nnls(A, wanted)
+        plan["active"] = moles > 0
+        plan["rows"] = np.flatnonzero(plan["stoichiometry"][:, plan["active"]].any(axis=1))
+    return {salt: float(moles[j]*plan["salt_masses"][j]) for j, salt in enumerate(plan["salts"]) if moles[j] > 0}
@@ -0,0 +1,182 @@
+"""
+This file contains the rendering of the figures of the package (ion and pH graphs, pH table).
+
+A figure is described by its kind and its data (lists and numbers only), so that it can be rendered in another
+process and hashed: a figure is not rendered again if the file already holds the same data.
+The figures are drawn with the object-oriented API of matplotlib (no pyplot state) and closed after saving.
+"""
+
+#Imports
+import os
+import io
+import json
+import hashlib
+import collections
+from concurrent.futures import ProcessPoolExecutor
+from .Instrumentation import instrumented, count
+
+#List of colors for the graphs
+python_colors = ['b', 'g', 'c', 'm', 'y', 'k',
+                 'tab:blue', 'tab:orange', 'tab:green', 'tab:red', 'tab:purple', 'tab:brown', 'tab:pink', 'tab:gray', 'tab:olive', 'tab:cyan',
+                 'mediumblue', 'darkorange', 'limegreen', 'indianred', 'violet', 'sienna', 'deepskyblue', 'peru', 'gold']
+
+#Hash of the data of the figures already rendered, by file path
+_RENDERED = {}
+#Figures rendered in memory, by hash of their data (the most recent ones only)
+_BUFFERS = collections.OrderedDict()
+_MAX_BUFFERS = 64
+
+# ----------------- Drawing functions -----------------
+
+def _draw_ion_graph(figure, data: dict) -> None:
+    """
+    Draws the evolution of the ions. data has the keys "days", "series" ({ion: concentrations}) and
+    "growth_limit" (None or [day, limiting ion]).
+    """
+    ax = figure.add_subplot()
+    ax.set_title('Evolution of the Ions in hydroponic solution', fontsize=16, weight='bold')
+    ax.set_xlabel('Time [days]', fontsize=14)
+    ax.set_ylabel('Concentration of the ion [g/L]', fontsize=14)
+    ax.grid(False)
+    ax.set_facecolor('#f9f9f9')
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    if data["growth_limit"] is not None:
+        day, ion = data["growth_limit"]
+        ax.axvline(x=day, color='r', linestyle='--', label=f'Growth limit: insufficient {ion}')
+    for i, (ion, concentrations) in enumerate(data["series"].items()):
+        ax.plot(data["days"], concentrations, label=ion, color=python_colors[i % len(python_colors)],
+                alpha=0.8, linewidth=1.5, linestyle='-', marker='o', markersize=3)
+    ax.legend(loc='best')
+
+def _draw_pH_graph(figure, data: dict) -> None:
+    """
+    Draws the pH over time. data has the keys "pH_values", "exceeded" (days out of the limits) and "limits" ([min, max]).
+    """
+    ax = figure.add_subplot()
+    pH_values = data["pH_values"]
+    ax.plot(pH_values, marker='o', label='pH values')
+    # Marked points where the pH exceeded the limits
+    for idx in data["exceeded"]:
+        ax.plot(idx, pH_values[idx], marker='o', color='red')
+    # Draw horizontal lines for acceptable pH range
+    ax.axhline(y=data["limits"][0], color='r', linestyle='--', label='Acceptable range (min)')
+    ax.axhline(y=data["limits"][1], color='g', linestyle='--', label='Acceptable range (max)')
+    ax.legend()
+    ax.set_xlabel('Days')
+    ax.set_ylabel('pH')
+    ax.set_title('pH Values Over Time')
+
+def _draw_pH_table(figure, data: dict) -> None:
+    """
+    Draws the table of the points of excess pH levels. data has the key "rows" ([[day, pH], ...]).
+    """
+    figure.patch.set_visible(False)
+    ax = figure.add_subplot()
+    ax.axis('off')
+    ax.axis('tight')
+    if data["rows"]:
+        ax.table(cellText=data["rows"], colLabels=['Day', 'pH'], cellLoc='center', loc='upper center')
+    ax.set_title("Points of Excess pH Levels")
+
+_DRAWERS = {"ions": _draw_ion_graph, "pH": _draw_pH_graph, "pH_table": _draw_pH_table}
+
+# ----------------- Rendering -----------------
+
+def figure_hash(kind: str, data: dict, figsize: tuple, dpi: float, format: str) -> str:
+    """
+    Returns a hash of everything that changes the rendered file.
+    """
+    content = json.dumps([kind, data, list(figsize), dpi, format], sort_keys=True, default=float)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+@instrumented("Render_Figures.render")
+def _render(job: dict, target=None) -> str:
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure(figsize=job["figsize"], dpi=job["dpi"])
+    FigureCanvasAgg(figure)
+    try:
+        _DRAWERS[job["kind"]](figure, job["data"])
+        figure.savefig(job["path"] if target is None else target, format=job["format"], dpi=job["dpi"])
+    finally:
+        figure.clear()
+    return job["path"]
+
+def _figure_job(kind: str, data: dict, path: str, dpi: float = 100, format: str = "png", figsize: tuple = (6.4, 4.8)) -> dict:
+    if kind not in _DRAWERS:
+        raise ValueError(f"Unknown figure: {kind}. Please choose one of {list(_DRAWERS)}.")
+    if path is not None and os.path.splitext(path)[1] != f".{format}":
+        path = f"{path}.{format}"
+    return {"kind": kind, "data": data, "path": path, "dpi": dpi, "format": format, "figsize": tuple(figsize),
+            "hash": figure_hash(kind, data, figsize, dpi, format)}
+
+def render_figures(jobs: list, processes: int = None) -> list:
+    """
+    Renders many figures in a pool of processes. A figure is skipped if its file was already rendered
+    from the same data and options.
+
+    Args:
+        jobs (list): list of dictionaries with the arguments of render_figure ("kind", "data", "path",
+            and optionally "dpi", "format" and "figsize").
+        processes (int, optional): number of worker processes, 1 renders in the current process. Defaults to the number of CPUs.
+
+    Returns:
+        list: the paths of the files, in the order of jobs.
+    """
+    jobs = [_figure_job(**job) for job in jobs]
+    todo = {}
+    for job in jobs:
+        if _RENDERED.get(job["path"]) != job["hash"] or not os.path.exists(job["path"]):
+            todo[job["path"]] = job
+    count("figures_reused", len(jobs) - len(todo))
+    if processes == 1 or len(todo) <= 1:
+        for job in todo.values():
+            _render(job)
+    elif todo:
+        with ProcessPoolExecutor(max_workers=min(processes or os.cpu_count() or 1, len(todo))) as executor:
+            list(executor.map(_render, todo.values()))
+    for job in todo.values():
+        _RENDERED[job["path"]] = job["hash"]
+    return [job["path"] for job in jobs]
+
+def render_figure(kind: str, data: dict, path: str, dpi: float = 100, format: str = "png", figsize: tuple = (6.4, 4.8)) -> str:
+    """
+    Renders one figure to a file, unless the file was already rendered from the same data and options.
+
+    Args:
+        kind (str): "ions", "pH" or "pH_table".
+        data (dict): the data of the figure (see the drawing functions), made of lists and numbers.
+        path (str): path of the file, the extension of the format is added if missing.
+        dpi (float, optional): resolution of raster formats. Defaults to 100.
+        format (str, optional): "png", "svg", "pdf", ... Defaults to "png".
+        figsize (tuple, optional): size of the figure [inches]. Defaults to (6.4, 4.8).
+
+    Returns:
+        str: the path of the file.
+    """
+    return render_figures([{"kind": kind, "data": data, "path": path, "dpi": dpi, "format": format, "figsize": figsize}], processes=1)[0]
+
+def render_figure_bytes(kind: str, data: dict, dpi: float = 100, format: str = "png", figsize: tuple = (6.4, 4.8)) -> bytes:
+    """
+    Renders one figure in memory, without touching the disk. The most recent figures are kept
+    and not rendered again if the data and options are unchanged.
+
+    Args:
+        kind, data, dpi, format, figsize: see render_figure.
+
+    Returns:
+        bytes: the content of the file.
+    """
+    job = _figure_job(kind, data, None, dpi, format, figsize)
+    if job["hash"] in _BUFFERS:
+        count("figures_reused")
+        _BUFFERS.move_to_end(job["hash"])
+    else:
+        buffer = io.BytesIO()
+        _render(job, buffer)
+        _BUFFERS[job["hash"]] = buffer.getvalue()
+        if len(_BUFFERS) > _MAX_BUFFERS:
+            _BUFFERS.popitem(last=False)
+    return _BUFFERS[job["hash"]]
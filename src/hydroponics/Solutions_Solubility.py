@@ -8,16 +8,74 @@ In particular, the file contains functions to:
 """
 
 #Imports
-import pandas as pd
 import math
-import matplotlib.pyplot as plt
 import os
+import itertools
+import collections
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from .Basic_functions import get_molar_mass, get_Ksp, get_Q_solubility, salt2ions, dict_salts_trad
+from .Basic_functions import _shared_tables, _install_tables
+from .Render_Figures import python_colors, render_figure
+from .Instrumentation import instrumented
+from .Ion_Registry import ion_formula
+from .Basic_functions import get_molar_mass, get_molar_masses, salt2ions, dict_salts_trad, salt_catalog
 
 # ----------------- Analyse the solution -----------------
 
+def _catalog_columns(ions: list) -> tuple:
+    """
+    Matches a list of ions with the columns of the salt catalog. Several names of a same ion (e.g. "CO3" and "CO3(2-)")
+    are summed into one column.
+
+    Returns:
+        tuple: (salt catalog, columns of the catalog, matrix [ions x columns] with a 1 where an ion is a name of the column)
+    """
+    catalog = salt_catalog()
+    catalog_columns = [catalog.column(ion) for ion in ions]
+    columns = list(dict.fromkeys(column for column in catalog_columns if column is not None))
+    merge = np.zeros((len(ions), len(columns)))
+    for j, column in enumerate(catalog_columns):
+        if column is not None:
+            merge[j, columns.index(column)] = 1
+    return catalog, columns, merge
+
+@instrumented()
+def check_solubility_batch(ion_concentrations: np.ndarray, ions: list, unit: str = "mol") -> np.ndarray:
+    """
+    Checks the solubility of many solutions at once by comparing log(Q) to log(Ksp) for every salt of dict_salts_trad.
+
+    Args:
+        ion_concentrations (np.ndarray): 2-D array [solutions x ions] of ion concentrations.
+        ions (list): names of the ions of the columns of ion_concentrations.
+        unit (str, optional): Unit of the concentrations, "mol" [mol/L] or "g" [g/L]. Defaults to "mol".
+
+    Returns:
+        np.ndarray: boolean matrix [solutions x salts], True where the salt precipitates.
+            The columns follow the order of the keys of dict_salts_trad.
+    """
+    if unit not in {"mol", "g"}:
+        raise ValueError("'Unit' must be 'g' or 'mol'.")
+    concentrations = np.atleast_2d(np.asarray(ion_concentrations, dtype=float))
+    if concentrations.shape[1] != len(ions):
+        raise ValueError("The number of columns must match the number of ions.")
+    if unit == "g":
+        concentrations = concentrations / get_molar_masses([ion_formula(ion) for ion in ions])
+    #Keep the ions that appear in a salt, adding up the names of a same ion
+    catalog, columns, merge = _catalog_columns(ions)
+    exponents, log_Ksp = catalog.exponents, catalog.log_Ksp
+    salt_exponents = exponents[:, columns]
+    concentrations = concentrations @ merge
+    
+    #A salt can only precipitate if all its ions are given
+    complete = (salt_exponents > 0).sum(axis=1) == (exponents > 0).sum(axis=1)
+    #Q = 0 if one of the ions of the salt has a zero concentration
+    positive = concentrations > 0
+    empty = (~positive).astype(float) @ (salt_exponents > 0).T > 0
+    log_Q = np.log(np.where(positive, concentrations, 1)) @ salt_exponents.T
+    return (log_Q > log_Ksp) & complete & ~empty
+
 #Check the solubility of the solution
+@instrumented()
 def check_solubility(salts_dict: dict, input_type: str = "salt", output_type: str = "bool") -> bool:
     """
     Check if the salts mixture is soluble.
@@ -42,26 +100,14 @@ def check_solubility(salts_dict: dict, input_type: str = "salt", output_type: st
     #Handle type of input and convert to mol/L
     if input_type == "salt":
         salts_dict_molar= {salt: concentration / get_molar_mass(salt) for salt, concentration in salts_dict.items()}
-        ions = salt2ions(salts_dict_molar, volume = 1)
+        ions = salt2ions(salts_dict_molar, volume = 1, unit = "mol")
     if input_type == "ion":
-        ions = {ion: concentration / get_molar_mass(ion) for ion, concentration in salts_dict.items()}
+        ions = {ion: concentration / get_molar_mass(ion_formula(ion)) for ion, concentration in salts_dict.items()}
         
-    #Initialize variables
-    soluble = True
-    precipitate = []
-    salts = dict_salts_trad.keys()
-    
-    #Compare Q and Ksp for each salt is the Ksp value is provided
-    for salt in salts:
-        try:
-            Ksp = get_Ksp(salt)
-            Q = get_Q_solubility(salt, ions)
-            if Q > Ksp and set(dict_salts_trad[salt].keys()).issubset(set(ions.keys())):
-                soluble = False
-                precipitate.append(salt)
-        except:
-            pass
-            
+    #Compare Q and Ksp for each salt
+    precipitation = check_solubility_batch(np.array([list(ions.values())]), list(ions))[0]
+    precipitate = [salt for salt, precipitates in zip(dict_salts_trad, precipitation) if precipitates]
+    soluble = len(precipitate) == 0
     
     #Handle type of output
     if output_type == "bool":
@@ -78,6 +124,7 @@ def check_solubility(salts_dict: dict, input_type: str = "salt", output_type: st
         return precipitate
     
 #analyse the nutriments in the solution
+@instrumented()
 def analyse_nutriments(solution: dict, plant: dict, growth_time: float, volume: float, input_type_solution: str= 'salt') -> list:
     """
     Returns the number of days a plant can grow with the given solution.
@@ -130,6 +177,74 @@ def analyse_nutriments(solution: dict, plant: dict, growth_time: float, volume:
         missing_ions = [ion for ion in plant.keys() if ion not in ions]
         return [False, 0, missing_ions]
    
+# ----------------- Scenario sweeps -----------------
+
+#Recipes and plants of the sweep in a worker process, set by _init_sweep_worker
+_SWEEP_INPUTS = None
+
+def _init_sweep_worker(tables: tuple, solutions: dict, plants: dict, input_type_solution: str) -> None:
+    global _SWEEP_INPUTS
+    _install_tables(tables)
+    _SWEEP_INPUTS = (solutions, plants, input_type_solution)
+
+def _sweep_chunk(scenarios: list) -> list:
+    solutions, plants, input_type_solution = _SWEEP_INPUTS
+    rows = []
+    for solution_name, plant_name, volume, growth_time in scenarios:
+        enough, growth_limit, limiting_ion = analyse_nutriments(solutions[solution_name], plants[plant_name], growth_time, volume, input_type_solution)
+        rows.append({"solution": solution_name, "plant": plant_name, "volume": volume, "growth_time": growth_time,
+                     "enough": enough, "growth_limit": growth_limit, "limiting_ion": limiting_ion})
+    return rows
+
+def iter_sweep_nutriments(solutions: dict, plants: dict, volumes: list, growth_times: list, input_type_solution: str = 'salt',
+                          processes: int = None, chunksize: int = None):
+    """
+    Runs analyse_nutriments for every combination of solution, plant, volume and growth time,
+    spread over a pool of processes, and yields the results as they come back (in the order of the combinations).
+
+    Args:
+        solutions (dict): dictionary with keys as names and values as solutions (see analyse_nutriments).
+        plants (dict): dictionary with keys as names and values as plant needs (see analyse_nutriments).
+        volumes (list): volumes of the solution [L].
+        growth_times (list): expected growth times of the plant [days].
+        input_type_solution (str, optional): Type of the solutions, either "salt" or "ion". Defaults to "salt".
+        processes (int, optional): number of worker processes, 1 runs in the current process. Defaults to the number of CPUs.
+        chunksize (int, optional): number of combinations sent to a worker at once. Defaults to about 4 chunks per worker.
+
+    Yields:
+        dict: one row per combination with the keys "solution", "plant", "volume", "growth_time",
+            "enough", "growth_limit" and "limiting_ion".
+    """
+    scenarios = list(itertools.product(solutions, plants, volumes, growth_times))
+    tables = _shared_tables()
+    if processes == 1:
+        _init_sweep_worker(tables, solutions, plants, input_type_solution)
+        yield from _sweep_chunk(scenarios)
+        return
+    processes = processes or os.cpu_count() or 1
+    chunksize = chunksize or max(1, math.ceil(len(scenarios)/(4*processes)))
+    chunks = [scenarios[i:i+chunksize] for i in range(0, len(scenarios), chunksize)]
+    #The molar masses and the Ksp values are sent once to each worker instead of being read again from the files
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_sweep_worker,
+                             initargs=(tables, solutions, plants, input_type_solution)) as executor:
+        for rows in executor.map(_sweep_chunk, chunks):
+            yield from rows
+
+def sweep_nutriments(solutions: dict, plants: dict, volumes: list, growth_times: list, input_type_solution: str = 'salt',
+                     processes: int = None, chunksize: int = None):
+    """
+    Runs analyse_nutriments for every combination of solution, plant, volume and growth time in parallel
+    (see iter_sweep_nutriments) and collects the results in a table.
+
+    Returns:
+        pd.DataFrame: one row per combination with the columns "solution", "plant", "volume", "growth_time",
+            "enough", "growth_limit" and "limiting_ion".
+    """
+    import pandas as pd
+    columns = ["solution", "plant", "volume", "growth_time", "enough", "growth_limit", "limiting_ion"]
+    rows = iter_sweep_nutriments(solutions, plants, volumes, growth_times, input_type_solution, processes, chunksize)
+    return pd.DataFrame(list(rows), columns=columns)
+
 #Check is enaugh nutriments are present in the solution
 def check_supply_elements(ions_solution, plant) -> bool:
     for ion in plant.keys():
@@ -170,16 +285,226 @@ def update_sol(ions_solution: dict, plant: dict, volume: float) -> dict:
             ions_solution[ion] = 0
         return ions_solution
     
+# Evolution of the concentration as the plant grows, array version
+def _restricted_solubility_tables(ions: list) -> tuple:
+    """
+    Restricts the solubility tables to the ions of a solution, to compute log(Q) from a vector of concentrations [g/L].
+
+    Returns:
+        tuple: (list of salts, matrix [ions x known ions] converting the concentrations [g/L] into mol/L and adding up
+            the names of a same ion, exponent matrix [salts x known ions], True for the salts whose ions are all in the solution,
+            log(Ksp) vector)
+    """
+    catalog, columns, merge = _catalog_columns(ions)
+    exponents = catalog.exponents
+    salt_exponents = exponents[:, columns]
+    complete = (salt_exponents > 0).sum(axis=1) == (exponents > 0).sum(axis=1)
+    known = merge.any(axis=1)
+    molar_masses = np.ones(len(ions))
+    molar_masses[known] = get_molar_masses([ion_formula(ion) for ion, is_known in zip(ions, known) if is_known])
+    to_molar = merge/molar_masses[:, None]
+    return catalog.salts, to_molar, salt_exponents, complete, catalog.log_Ksp
+
+def iter_growth(solution: dict, volume: float, plant: dict, growth_time: float, dt: float = 1):
+    """
+    Simulates the evolution of the solution step by step and yields each state without storing the history,
+    so that long simulations with small steps run in constant memory.
+    The solubility is only checked again for the salts whose ions changed during the step.
+    
+    Args:
+        solution (dict): Initial concentration [g/L] of the ions in the solution.
+        volume (float): Volume of the solution [L].
+        plant (dict): Dictionary containing required amount of ions for the plant growth [g].
+        growth_time (float): Expected growth time of the plant [days].
+        dt (float, optional): time step [days], e.g. 1/24 for hourly steps. Defaults to 1.
+    
+    Yields:
+        tuple: (time [days], concentration [g/L] of the ions in the order of solution,
+            boolean vector of the salts of dict_salts_trad, True where the salt precipitates).
+            The arrays must not be modified.
+    """
+    ions = list(solution)
+    missing_ions = [ion for ion in plant if ion not in solution]
+    if missing_ions and growth_time >= 1:
+        raise ValueError(f"{missing_ions[0]} is not present in the solution but is required for the plant growth.")
+    if dt <= 0:
+        raise ValueError("The time step must be positive.")
+    #The last step is shortened if growth_time is not a multiple of dt
+    steps = math.ceil(round(growth_time/dt, 9))
+    last_step = growth_time - (steps-1)*dt
+    step_need = np.array([plant.get(ion, 0)*dt/growth_time for ion in ions], dtype=float)
+    needed = np.array([ion in plant for ion in ions])
+    uptake = step_need/volume
+    
+    salts, to_molar, salt_exponents, complete, log_Ksp = _restricted_solubility_tables(ions)
+    
+    def precipitation(state: np.ndarray, affected: np.ndarray) -> np.ndarray:
+        molar = state @ to_molar
+        positive = molar > 0
+        log_Q = salt_exponents[affected] @ np.log(np.where(positive, molar, 1))
+        empty = (salt_exponents[affected] > 0) @ ~positive
+        return (log_Q > log_Ksp[affected]) & complete[affected] & ~empty
+    
+    state = np.array([solution[ion] for ion in ions], dtype=float)
+    precipitates = precipitation(state, np.ones(len(salts), dtype=bool))
+    yield 0*dt, state, precipitates
+    growing = True
+    for step in range(1, steps+1):
+        fraction = 1 if step < steps or math.isclose(last_step, dt) else last_step/dt
+        #The plant stops growing as soon as one ion does not cover its need for the step
+        growing = growing and not (fraction*step_need[needed] > state[needed]).any()
+        if growing:
+            previous = state
+            state = np.where(state <= fraction*uptake, 0, state - fraction*uptake)
+            state[~needed] = previous[~needed]
+            changed = (state != previous) @ (to_molar > 0)
+            affected = (salt_exponents[:, changed] > 0).any(axis=1)
+            precipitates = precipitates.copy()
+            precipitates[affected] = precipitation(state, affected)
+        yield (step*dt if fraction == 1 else growth_time), state, precipitates
+
+@instrumented()
+def simulate_growth(solution: dict, volume: float, plant: dict, growth_time: float, dt: float = 1,
+                    every: int = 1, keep_last: int = None) -> dict:
+    """
+    Simulates the evolution of the solution, as data4graph, on NumPy arrays (see iter_growth).
+    
+    Args:
+        solution (dict): Initial concentration [g/L] of the ions in the solution.
+        volume (float): Volume of the solution [L].
+        plant (dict): Dictionary containing required amount of ions for the plant growth [g].
+        growth_time (float): Expected growth time of the plant [days].
+        dt (float, optional): time step [days]. Defaults to 1.
+        every (int, optional): only keep one step out of every, to downsample fine simulations. Defaults to 1.
+        keep_last (int, optional): only keep the last keep_last kept steps, in a ring buffer. Defaults to None (keep all).
+    
+    Returns:
+        dict: dictionary with the keys
+            - "days" (np.ndarray): the times of the kept steps [0,dt,2*dt,...,growth_time],
+            - "ions" (list): the ions of the columns, in the order of solution,
+            - "concentrations" (np.ndarray): concentration [g/L] of the ions [steps x ions],
+            - "salts" (list): the salts of dict_salts_trad,
+            - "precipitates" (np.ndarray): boolean matrix [steps x salts], True where the salt precipitates,
+            - "analysis" (list): the result of analyse_nutriments (enough nutriments, growth limit, limiting ion),
+            - "solution", "volume", "plant", "growth_time": the inputs of the simulation.
+        The result can be given to plot_graph, generation_of_pH_list and generate_report instead of simulating again.
+    """
+    states = itertools.islice(iter_growth(solution, volume, plant, growth_time, dt), 0, None, every)
+    if keep_last is not None:
+        states = collections.deque(states, maxlen=keep_last)
+    times, concentrations, precipitates = zip(*states)
+    return {"days": np.array(times), "ions": list(solution), "concentrations": np.array(concentrations),
+            "salts": salt_catalog().salts, "precipitates": np.array(precipitates),
+            "analysis": analyse_nutriments(solution, plant, growth_time, volume, input_type_solution = 'ion'),
+            "solution": dict(solution), "volume": volume, "plant": dict(plant), "growth_time": growth_time}
+
+@instrumented()
+def simulate_growth_events(solution: dict, volume: float, plant: dict, growth_time: float) -> dict:
+    """
+    Computes the evolution of the solution of simulate_growth in closed form, without stepping through the days.
+    The concentrations decrease linearly until the ion runs out or the plant stops growing, so the solubility
+    product of every salt only decreases: each salt precipitates until a single dissolution time, found by bisection.
+    The cost depends on the number of ions and salts, not on the growth time.
+    
+    Args:
+        solution (dict): Initial concentration [g/L] of the ions in the solution.
+        volume (float): Volume of the solution [L].
+        plant (dict): Dictionary containing required amount of ions for the plant growth [g].
+        growth_time (float): Expected growth time of the plant [days].
+    
+    Returns:
+        dict: dictionary with the keys
+            - "ions" (list): the ions, in the order of solution,
+            - "initial" (np.ndarray): initial concentration [g/L] of the ions,
+            - "uptake" (np.ndarray): daily uptake [g/L/day] of the ions,
+            - "stop_time" (float): day after which the plant stops growing and the solution stays constant,
+            - "depletion_times" (np.ndarray): day at which each ion runs out (inf if it never does),
+            - "salts" (list): the salts of dict_salts_trad,
+            - "dissolution_times" (np.ndarray): day at which each salt stops precipitating
+              (0 if it never precipitates, inf if it precipitates until the end),
+            - "events" (list): the (day, kind, name) events sorted by day, kind is "depleted", "dissolved" or "stopped".
+    """
+    ions = list(solution)
+    missing_ions = [ion for ion in plant if ion not in solution]
+    if missing_ions and growth_time >= 1:
+        raise ValueError(f"{missing_ions[0]} is not present in the solution but is required for the plant growth.")
+    initial = np.array([solution[ion] for ion in ions], dtype=float)
+    daily_need = np.array([plant.get(ion, 0)/growth_time for ion in ions], dtype=float)
+    uptake = daily_need/volume
+    growing = np.array([ion in plant for ion in ions]) & (uptake > 0)
+    
+    #The plant stops growing on the first day where an ion does not cover its daily need (same rule as simulate_growth)
+    last_days = np.full(len(ions), np.inf)
+    covered = growing & (initial >= daily_need)
+    last_days[growing] = 0
+    last_days[covered] = np.floor((initial[covered] - daily_need[covered])/uptake[covered]) + 1
+    stop_time = float(min(growth_time, last_days.min()))
+    depletion_times = np.full(len(ions), np.inf)
+    depletion_times[growing] = initial[growing]/uptake[growing]
+    depletion_times[depletion_times > stop_time] = np.inf
+    
+    salts, to_molar, salt_exponents, complete, log_Ksp = _restricted_solubility_tables(ions)
+    
+    def precipitation(times: np.ndarray) -> np.ndarray:
+        #One time per salt: True where the salt precipitates at its time
+        states = np.maximum(initial - np.minimum(times, stop_time)[:, None]*uptake, 0)
+        molar = states @ to_molar
+        positive = molar > 0
+        log_Q = (salt_exponents*np.log(np.where(positive, molar, 1))).sum(axis=1)
+        empty = ((salt_exponents > 0) & ~positive).any(axis=1)
+        return (log_Q > log_Ksp) & complete & ~empty
+    
+    dissolution_times = np.zeros(len(salts))
+    start = precipitation(np.zeros(len(salts)))
+    dissolution_times[start & precipitation(np.full(len(salts), stop_time))] = np.inf
+    dissolving = start & ~np.isinf(dissolution_times)
+    if dissolving.any():
+        low, high = np.zeros(len(salts)), np.full(len(salts), stop_time)
+        for _ in range(60):
+            middle = (low + high)/2
+            precipitating = precipitation(middle)
+            low = np.where(precipitating, middle, low)
+            high = np.where(precipitating, high, middle)
+        dissolution_times[dissolving] = high[dissolving]
+    
+    events = [(float(t), "depleted", ion) for t, ion in zip(depletion_times, ions) if np.isfinite(t)]
+    events += [(float(t), "dissolved", salt) for t, salt, d in zip(dissolution_times, salts, dissolving) if d]
+    events.append((stop_time, "stopped", None))
+    events.sort(key=lambda event: event[0])
+    return {"ions": ions, "initial": initial, "uptake": uptake, "stop_time": stop_time, "depletion_times": depletion_times,
+            "salts": salts, "dissolution_times": dissolution_times, "events": events}
+
+def evaluate_growth_events(simulation: dict, times) -> dict:
+    """
+    Evaluates the result of simulate_growth_events at any times, e.g. every hour of a year.
+    
+    Args:
+        simulation (dict): result of simulate_growth_events.
+        times (array-like): times [days] where the solution is evaluated.
+    
+    Returns:
+        dict: dictionary with the keys "days", "ions", "concentrations" [times x ions], "salts" and
+            "precipitates" [times x salts], as simulate_growth.
+    """
+    times = np.asarray(times, dtype=float)
+    elapsed = np.minimum(times, simulation["stop_time"])
+    concentrations = np.maximum(simulation["initial"] - elapsed[:, None]*simulation["uptake"], 0)
+    precipitates = times[:, None] < simulation["dissolution_times"]
+    return {"days": times, "ions": simulation["ions"], "concentrations": concentrations,
+            "salts": simulation["salts"], "precipitates": precipitates}
+
 # Evolution of the concentration as the plant grows (internal function)
-def data4graph(solution: dict, volume: float, plant: dict, growth_time: float) -> list:
+@instrumented()
+def data4graph(solution: dict, volume: float, plant: dict, growth_time: float, dt: float = 1) -> list:
     """
-    Creates a dictionary with the data needed to plot the graph
+    Creates a dictionary with the data needed to plot the graph (see simulate_growth for the array version).
     
     Args:
         solution (dict): Initial concentration [g/L] of the ions in the solution.
         volume (float): Volume of the solution [L].
         plant (dict): Dictionary containing required amount of ions for the plant growth.
         growth_time (float): Expected growth time of the plant [days].
+        dt (float, optional): time step [days]. Defaults to 1.
     
     Returns:
         list: A list containing two elements:
@@ -187,32 +512,14 @@ def data4graph(solution: dict, volume: float, plant: dict, growth_time: float) -
             - list: A list of dictionaries with the concentration of ions in the solution for each day.
     
     """
-    #Initialisation:
-    daily_need_plant = {ion: plant[ion]/growth_time for ion in plant.keys()}
-    data = [[],[]] #data = [[0,1,2,3,4,5,6,...],[{"Na",0.1,"K",0.2,...}, {"Na": 0.05, "K": 0.1,...},...]]
-    i=0
-    data[0].append(i)
-    data[1].append(solution.copy())
-    
-    #Loop trough further values
-    for i in range(1,growth_time+1):
-            if check_supply_elements(solution, daily_need_plant):
-                solution = update_sol(solution, daily_need_plant, volume)
-                data[0].append(i)
-                data[1].append(solution.copy())
-            else:
-                data[0].append(i)
-                data[1].append(solution.copy())
-        
+    simulation = simulate_growth(solution, volume, plant, growth_time, dt)
+    #data = [[0,1,2,3,4,5,6,...],[{"Na",0.1,"K",0.2,...}, {"Na": 0.05, "K": 0.1,...},...]]
+    data = [simulation["days"].tolist(), [dict(zip(simulation["ions"], row)) for row in simulation["concentrations"].tolist()]]
     return data
     
-#List of colors for the graph
-python_colors = ['b', 'g', 'c', 'm', 'y', 'k',
-                 'tab:blue', 'tab:orange', 'tab:green', 'tab:red', 'tab:purple', 'tab:brown', 'tab:pink', 'tab:gray', 'tab:olive', 'tab:cyan',
-                 'mediumblue', 'darkorange', 'limegreen', 'indianred', 'violet', 'sienna', 'deepskyblue', 'peru', 'gold']
-
 #Plot the evolution of the solution
-def plot_graph(solution: dict, input_type:str, plant:dict, growth_time:float, volume:float = 1, ions_of_interest: list = "all"):
+def plot_graph(solution: dict, input_type:str, plant:dict, growth_time:float, volume:float = 1, ions_of_interest: list = "all",
+               output_dir: str = None, dpi: float = 500, format: str = "png", simulation: dict = None) -> str:
     """
     Creates graph of salts in hydroponic solution
 
@@ -224,59 +531,36 @@ def plot_graph(solution: dict, input_type:str, plant:dict, growth_time:float, vo
         volume (float, optional): Volume of the solution [L]. Defaults to 1.
         ions_of_interest (list, optional): list of ions to plot. Defaults to "all". 
             Elements must be part of the keys of solution.
+        output_dir (str, optional): folder of the graph. Defaults to the current directory.
+        dpi (float, optional): resolution of the graph. Defaults to 500.
+        format (str, optional): format of the file, e.g. "png" or "svg". Defaults to "png".
+        simulation (dict, optional): result of simulate_growth for this solution, to plot without simulating again.
     
     Returns:
-        None, saves the graph as a .png file in the download folder.
+        str: the path of the graph. The graph is not rendered again if it is unchanged.
     """
-    
-    #Initialise the figure and aesthetics
-    plt.figure(figsize=(12, 6), dpi = 500)
-    plt.title('Evolution of the Ions in hydroponic solution', fontsize=16, weight='bold')
-    plt.xlabel(f'Time [days]', fontsize=14)
-    plt.ylabel('Concentration of the ion [g/L]', fontsize=14)
-    plt.grid(False)
-    plt.gca().set_facecolor('#f9f9f9')
-    plt.gca().spines['top'].set_visible(False)
-    plt.gca().spines['right'].set_visible(False)
-    
-    # Setting y-axis to log scale
-    #plt.yscale('log')
-    
-    
-    #xlength = analyse_nutriments(solution, plant, growth_time, volume, input_type_solution = 'ion')[1]
-    
-    #Handle Input type
-    if input_type == "salt":
-        initial_ion_solution = salt2ions(solution, volume)
-    else:
-        initial_ion_solution = solution.copy()
-        
+    if simulation is None:
+        #Handle Input type
+        if input_type == "salt":
+            initial_ion_solution = salt2ions(solution)
+        else:
+            initial_ion_solution = solution.copy()
+        simulation = simulate_growth(initial_ion_solution, volume, plant, growth_time)
+    data = _ion_graph_data(ions_of_interest, simulation)
+    return render_figure("ions", data, _ion_graph_path(output_dir, ions_of_interest), dpi=dpi, format=format, figsize=(12, 6))
+
+def _ion_graph_data(ions_of_interest: list, simulation: dict) -> dict:
     #add the growth limit
-    analysis = analyse_nutriments(initial_ion_solution, plant, growth_time, volume, input_type_solution = 'ion')
-    if analysis[1] != growth_time:
-        plt.axvline(x=analysis[1], color='r', linestyle='--', label=f'Growth limit: insufficient {analysis[2]}')
-        
-    #Plot the data for the ions of interest
-    i = 0 #handle the colors    
-    data = data4graph(initial_ion_solution, volume, plant, growth_time)
-    for ion in initial_ion_solution.keys():
-        if ion in ions_of_interest or ions_of_interest == "all":
-            x = data[0]
-            y = []
-            for j in range(len(x)):
-                y.append(data[1][j][ion])
-            plt.plot(x, y, label = ion, color = python_colors[i],alpha=0.8, linewidth=1.5, linestyle='-', marker='o', markersize=3)
-            i+=1
-            
-    
-    plt.legend(loc='best')
-    
-    #Save Graph to the current directory
-    current_dir = os.path.dirname(os.path.realpath(__file__))
+    analysis = simulation["analysis"]
+    growth_limit = [analysis[1], analysis[2]] if analysis[1] != simulation["growth_time"] else None
+    #Data for the ions of interest
+    series = {ion: simulation["concentrations"][:, j].tolist() for j, ion in enumerate(simulation["ions"])
+              if ion in ions_of_interest or ions_of_interest == "all"}
+    return {"days": simulation["days"].tolist(), "series": series, "growth_limit": growth_limit}
+
+def _ion_graph_path(output_dir: str, ions_of_interest: list) -> str:
+    #Save Graph to the output directory
     file_name = "graph_"
     for ion in ions_of_interest:
         file_name += str(ion) + "_"
-    file_path = os.path.join(current_dir, file_name)
-    plt.savefig(file_path + ".png", format='png')  # Save as a PNG file for matplotlib
-    
- 
\ No newline at end of file
+    return os.path.join(output_dir or os.getcwd(), file_name)
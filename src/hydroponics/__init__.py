@@ -1,7 +1,46 @@
 """Simulation of hydroponic farming."""
-from .Basic_functions import *
-from .Generate_Report import *
-from .Solutions_Solubility import *
-from .pH_graph_0 import *
-from .PH_Approximation_0 import *
-from .Refill_0 import *
+import importlib
+
+#Public names of the package and the submodule defining them.
+#A submodule, and its dependencies (pandas, sympy, matplotlib, reportlab), is only imported when one of its names is first used.
+_LAZY_NAMES = {
+    "Basic_functions": [
+        "load_from_data", "read_user_workbook", "import_solution_data", "predefined_solutions", "import_plant_data",
+        "reload_atom_masses", "get_atom_mass", "parse_formula", "formula_vector", "atom_symbols",
+        "get_molar_masses", "get_molar_mass", "salt2nbIons", "dict_salts_trad", "reload_Ksp_registry",
+        "get_Ksp", "get_Ksp_many", "SaltCatalog", "salt_catalog", "register_salt", "get_Q_solubility", "salt2ions",
+        "salt2ions_batch", "make_solution",
+    ],
+    "Generate_Report": ["merge_dicts", "generate_report", "generate_reports"],
+    "Solutions_Solubility": [
+        "check_solubility_batch", "check_solubility", "analyse_nutriments", "iter_sweep_nutriments", "sweep_nutriments",
+        "check_supply_elements",
+        "update_sol", "iter_growth", "simulate_growth", "simulate_growth_events", "evaluate_growth_events", "data4graph", "python_colors", "plot_graph",
+    ],
+    "pH_graph_0": ["pH_limit_of_plants", "generation_of_pH_list", "pH_graph", "pH_part_of_report_generation"],
+    "PH_Approximation_0": [
+        "pH_approximation", "pH_approximation_batch", "Ksp_values", "pKa_values", "Test_concentration_of_solution",
+        "expected_pH", "Value_of_Ionisation_Constant", "compound_charge", "highest_existing_charge_of_compounds",
+        "find_acid", "speciation", "register_acid",
+    ],
+    "Ion_Registry": ["register_ion", "ion_id", "ion_ids", "ion_name", "canonical_ion", "ion_formula", "ion_charge", "ion_composition"],
+    "Instrumentation": ["reset_instrumentation", "instrumentation_snapshot", "prometheus_text"],
+    "Render_Figures": ["figure_hash", "render_figure", "render_figures", "render_figure_bytes"],
+    "Refill_0": ["Refill_of_container", "plan_refill", "Concentration_Checker", "SimulatedSensor"],
+}
+_NAME_TO_MODULE = {name: module for module, names in _LAZY_NAMES.items() for name in names}
+
+__all__ = list(_NAME_TO_MODULE)
+
+def __getattr__(name: str):
+    if name in _NAME_TO_MODULE:
+        module = importlib.import_module(f".{_NAME_TO_MODULE[name]}", __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    if name in _LAZY_NAMES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__() -> list:
+    return sorted(set(globals()) | set(__all__) | set(_LAZY_NAMES))
@@ -1,6 +1,7 @@
-import matplotlib.pyplot as plt  # Importing matplotlib for plotting
-import pandas as pd
-from hydroponics.PH_Approximation_0 import pH_approximation
+from hydroponics.PH_Approximation_0 import pH_approximation_batch
+from hydroponics.Basic_functions import get_molar_masses
+from hydroponics.Ion_Registry import ion_formula
+from hydroponics.Render_Figures import render_figures
 import os
 
 #Dictionary with optimal range for plants to grow in 
@@ -15,8 +16,9 @@ def generation_of_pH_list(concentrations_list:list, temperature:float, plant:str
     Generate pH values and identifies days where pH exceeded limits.
 
     Parameters:
-        concentrations_list (list): list of dictionaries of concentrations throughout days, with the index of the 
-        dictionary in the list being the day where the concentrations were derived.
+        concentrations_list (list): list of dictionaries of concentrations [mol/L] throughout days, with the index of the 
+        dictionary in the list being the day where the concentrations were derived, or the result of simulate_growth
+        (concentrations in g/L, converted to mol/L).
         temperature (float): Temperature of the solution in degrees celcius.
         plant (str): Name of the plant.
 
@@ -24,16 +26,20 @@ def generation_of_pH_list(concentrations_list:list, temperature:float, plant:str
         list: pH values for each concentration dictionary.
         list: Indices of days where pH exceeded limits.
     """
-    pH_values = []  # List to store pH values
     Days_where_pH_was_exceeded = []  # List to store indices of days where pH exceeded limits
 
-    # Loop through each concentration in the array
-    for i in range(len(concentrations_list)):
-        # Calculate pH value for the concentration
-        pH_value = pH_approximation(concentrations_list[i], temperature)
-        # Append pH value to the list
-        pH_values.append(pH_value)
-        
+    # Solve all the days at once on a days x species array
+    if isinstance(concentrations_list, dict):
+        # Result of simulate_growth: the array is already there, in g/L
+        species = concentrations_list["ions"]
+        concentrations_array = concentrations_list["concentrations"]/get_molar_masses([ion_formula(ion) for ion in species])
+    else:
+        species = list(dict.fromkeys(compound for concentrations in concentrations_list for compound in concentrations))
+        concentrations_array = [[concentrations.get(compound, 0) for compound in species] for concentrations in concentrations_list]
+    pH_values = pH_approximation_batch(concentrations_array, species, temperature).tolist() if len(concentrations_array) else []
+
+    # Loop through each pH value
+    for i, pH_value in enumerate(pH_values):
         # Check if the pH value is within specified limits for the plant
         if plant in pH_limit_of_plants:
             if pH_limit_of_plants[plant][0] < pH_value < pH_limit_of_plants[plant][1]:
@@ -50,78 +56,39 @@ def generation_of_pH_list(concentrations_list:list, temperature:float, plant:str
     return pH_values, Days_where_pH_was_exceeded
 
 
-def pH_graph(pH_values:list,Days_where_pH_was_exceeded:list,plant:str)->None:
+def pH_graph(pH_values:list,Days_where_pH_was_exceeded:list,plant:str, output_dir:str=None, dpi:float=500, format:str="png",
+             processes:int=1)->tuple:
     """"
     Generates a graph of pH values over time, with marked points where pH exceeded limits and a table of points of excess pH levels. The two figures
-    are saved as png files. 
+    are saved as files (see Render_Figures), and are not rendered again if they are unchanged. 
     Parameters:
         pH_values (tuple of lists of pH values over time)
         Days_where_pH_was_exceeded (list)
         plant (str)
+        output_dir (str): folder of the figures. Defaults to the current directory.
+        dpi (float): resolution of the figures. Defaults to 500.
+        format (str): format of the files, e.g. "png" or "svg". Defaults to "png".
+        processes (int): number of processes rendering the two figures. Defaults to 1.
     Returns:
-        None
+        tuple: paths of the graph and of the table.
 
     """
+    return tuple(render_figures(_pH_figure_jobs(pH_values, Days_where_pH_was_exceeded, plant, output_dir, dpi, format), processes))
+
+def _pH_figure_jobs(pH_values:list, Days_where_pH_was_exceeded:list, plant:str, output_dir:str, dpi:float, format:str)->list:
     # Define acceptable pH range for a specific plant
     pH_range_min =pH_limit_of_plants[plant][0]
     pH_range_max =pH_limit_of_plants[plant][1]
+    output_dir = output_dir or os.getcwd()
 
-    # Plot pH values
-    plt.figure(figsize=(12, 6), dpi = 500)
-    plt.plot(pH_values, marker='o', label='pH values')
-    
-    color = 'red'  # Color for the marked points
-
-    for idx in Days_where_pH_was_exceeded:
-        plt.plot(idx, pH_values[idx], marker='o', color=color)  # Plot each marked point with the specified color
-
-    # Draw horizontal lines for acceptable pH range
-    plt.axhline(y=pH_range_min, color='r', linestyle='--', label='Acceptable range (min)')
-    plt.axhline(y=pH_range_max, color='g', linestyle='--', label='Acceptable range (max)')
-
-    # Add legend
-    plt.legend()
+    # Rows of the table of points of excess
+    rows = [[i, pH_values[i]] for i in Days_where_pH_was_exceeded]
 
-    # Add labels and title
-    plt.xlabel('Days')
-    plt.ylabel('pH')
-    plt.title('pH Values Over Time')
-
-    #Save Graph to the current directory
-    current_dir = os.path.dirname(os.path.realpath(__file__))
-    file_name = "graph_pH"
-    file_path = os.path.join(current_dir, file_name)
-    plt.savefig(file_path + ".png", format='png')  # Save as a PNG file for matplotlib
-
-    # Initialize an empty list to hold dictionaries
-    data_dict_list = []
-
-    for i in Days_where_pH_was_exceeded:
-        # Create a dictionary for each row
-        row_dict = {
-            'Day': i,
-            'pH': pH_values[i]
-        }
-        # Append the dictionary to the list
-        data_dict_list.append(row_dict)
-
-    # Convert the list of dictionaries to a DataFrame
-    table_of_points_of_excess = pd.DataFrame(data_dict_list)
-        # Plot the table with a title
-    fig, ax = plt.subplots()
-    fig.patch.set_visible(False)
-    ax.axis('off')
-    ax.axis('tight')
-    ax.table(cellText=table_of_points_of_excess.values,
-             colLabels=table_of_points_of_excess.columns,
-             cellLoc='center', loc='upper center')
-    plt.title("Points of Excess pH Levels")
-    
-    #Save Graph to the current directory
-    current_dir = os.path.dirname(os.path.realpath(__file__))
-    file_name = "Table_pH"
-    file_path = os.path.join(current_dir, file_name)
-    plt.savefig(file_path + ".png", format='png')  # Save as a PNG file for matplotlib
+    return [
+        {"kind": "pH", "data": {"pH_values": list(pH_values), "exceeded": list(Days_where_pH_was_exceeded), "limits": [pH_range_min, pH_range_max]},
+         "path": os.path.join(output_dir, "graph_pH"), "dpi": dpi, "format": format, "figsize": (12, 6)},
+        {"kind": "pH_table", "data": {"rows": rows}, "path": os.path.join(output_dir, "Table_pH"), "dpi": dpi, "format": format},
+    ]
 '''
 # Example of values for testing pH graph
 pH_values = [6.4, 6.5, 6.8, 6.2, 6.4, 6.4, 6.0, 5.8]
@@ -129,19 +96,21 @@ Days_where_pH_was_exceeded=[6,7]
 pH_graph(pH_values,Days_where_pH_was_exceeded,"tomatoes")
 '''
 
-def pH_part_of_report_generation(concentrations_list:list, temperature:float, plant:str)->None:
+def pH_part_of_report_generation(concentrations_list:list, temperature:float, plant:str, output_dir:str=None, dpi:float=500,
+                                 format:str="png")->tuple:
     """"
     Generates a pH graph and a table of points of excess pH levels by calling the generation_of_pH _list function followed 
-    by the pH_graph function, the latter saving the figures as png files. 
+    by the pH_graph function, the latter saving the figures as files. 
     Parameters:
-        concentrations_list (dict) 
+        concentrations_list (list or dict): see generation_of_pH_list
         temperature (float)
         plant (str)
+        output_dir (str), dpi (float), format (str): see pH_graph
     Returns:
-        None
+        tuple: paths of the graph and of the table.
     """
     pH_values, Days_where_pH_was_exceeded=generation_of_pH_list(concentrations_list, temperature, plant)
-    pH_graph(pH_values,Days_where_pH_was_exceeded,plant)
+    return pH_graph(pH_values,Days_where_pH_was_exceeded,plant,output_dir,dpi,format)
 
     
     
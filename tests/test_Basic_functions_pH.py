@@ -3,16 +3,51 @@
 # Importing functions from Basic_functions.py file
 import sys
 import os
+import asyncio
+import numpy as np
 from pytest import approx
 sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
 from hydroponics import *
+from hydroponics import Basic_functions, PH_Approximation_0
+
+#--------------------------- Test the Excel importers ------------------------------
+def test_user_workbook_cache():
+    sheets = read_user_workbook()
+    assert read_user_workbook() is sheets, "Test read_user_workbook failed: the workbook was parsed twice"
+    assert {"My solution", "Optimal Solution", "My plant"}.issubset(sheets), "Test read_user_workbook failed: missing sheets"
+    assert predefined_solutions("Tomato")["K+"] == approx(0.254137), "Test predefined_solutions failed"
+    assert import_plant_data("Example_plant") == {"Na+": 0.1, "Cl-": 0.2}, "Test import_plant_data failed"
 
 #--------------------------- Test get_molar_mass() ------------------------------
 def test_molar_mass ():
     mol = ["Ca(NO3)2", "Ca(2+)(NO3)2(-)", "Ca++(NO3)2", "Ca(NO3)NO3"]
     for i in range(len(mol)):
         assert round(get_molar_mass(mol[i]),3) == 164.086, "Test molar mass failed: did not understand {mol[i]}"
-           
+
+def test_parse_formula():
+    assert parse_formula("K4(Fe(CN)6)") == {"K": 4, "Fe": 1, "C": 6, "N": 6}, "Test parse_formula failed: nested brackets"
+    assert parse_formula("SO4(2-)") == {"S": 1, "O": 4}, "Test parse_formula failed: charge"
+    assert parse_formula("CaSO4·2H2O") == {"Ca": 1, "S": 1, "O": 6, "H": 4}, "Test parse_formula failed: hydrate"
+    assert parse_formula("C10H12FeN2NaO8")["C"] == 10, "Test parse_formula failed: multi-digit count"
+    assert list(get_molar_masses(["Ca(NO3)2", "NaCl"])) == approx([164.086, 58.44], rel=1e-4), "Test get_molar_masses failed"
+    try:
+        parse_formula("Ca(NO3")
+        assert False, "Test parse_formula failed: unbalanced brackets accepted"
+    except ValueError:
+        pass
+
+
+#--------------------------- Test get_atom_mass() ------------------------------
+def test_atom_mass_index():
+    assert get_atom_mass("Ca") == 40.078, "Test atom mass failed"
+    assert get_atom_mass("Xx") is None, "Test atom mass failed: unknown atom should return None"
+    masses = reload_atom_masses()
+    assert masses["O"] == get_atom_mass("O"), "Test reload_atom_masses failed"
+    # The Ksp values depend on the molar masses and are computed again
+    get_Ksp("KNO3")
+    reload_atom_masses()
+    assert Basic_functions._MOLAR_SOLUBILITIES is None, "Test reload_atom_masses failed: Ksp values kept"
+    assert get_Ksp("KNO3") == approx(9.76904463917891, rel=1e-3), "Test reload_atom_masses failed: get_Ksp"
 
 
 #--------------------------- Test get_Ksp() ------------------------------
@@ -35,6 +70,9 @@ def test_get_Ksp():
     ]
     for i in range(len(list)):
         assert get_Ksp(list[i]) == approx(Ksp_list[i], rel=1e-3), f"Test_get_Ksp failed: Error for {list[i]}"
+    assert get_Ksp_many(list).tolist() == approx(Ksp_list, rel=1e-3), "Test get_Ksp_many failed"
+    reload_Ksp_registry()
+    assert get_Ksp('KNO3') == approx(Ksp_list[0], rel=1e-3), "Test reload_Ksp_registry failed"
         
         
 
@@ -43,6 +81,9 @@ def test_Get_Q():
     salt = "Ca(NO3)2"
     ions = {"Ca(2+)": 0.5, "NO3(-)": 0.5, "Cl-": 0.5}
     assert get_Q_solubility(salt, ions) == 0.125, "Test get_Q failed"
+    # The names of a same ion add up
+    ions = {"Ca(2+)": 0.5, "CO3": 0.25, "CO3(2-)": 0.25}
+    assert get_Q_solubility("CaCO3", ions) == 0.25, "Test get_Q failed: aliases"
     
     
 #----------------------------- Test salt2ions() ----------------------------
@@ -52,7 +93,9 @@ def test_mol_unit():
     
 def test_g_unit():
     solution_dict = {"NaCl": 0.1, "KBr": 0.05} # 0.1 g/L NaCl, 0.05 g/L KBr
-    assert salt2ions(solution_dict, volume=2, unit='g') == {'Na+': 4.597953856, 'Cl-': 7.090000000000001, 'K+': 3.9098300000000004, 'Br-': 7.9904}, "Salt2Ions: Test_g_unit failed"
+    #g/L of salt / molar mass of the salt * molar mass of the ion * volume
+    expected = {'Na+': 0.1/58.443*22.990*2, 'Cl-': 0.1/58.443*35.453*2, 'K+': 0.05/119.002*39.098*2, 'Br-': 0.05/119.002*79.904*2}
+    assert salt2ions(solution_dict, volume=2, unit='g') == approx(expected, rel=1e-3), "Salt2Ions: Test_g_unit failed"
 
 def test_invalid_volume():
     solution_dict = {"NaCl": 0.1, "KBr": 0.05}
@@ -62,6 +105,42 @@ def test_invalid_volume():
         assert "{}".format(e) == "Volume must be positive.", "Salt2Ions: invalid volume failed"
         
 
+def test_salt2ions_batch():
+    recipes = [{"NaCl": 0.1, "KBr": 0.05}, {"NaCl": 0.3, "KBr": 0}]
+    for unit in ["g", "mol"]:
+        ions = salt2ions_batch(np.array([[0.1, 0.05], [0.3, 0]]), volume=2, unit=unit, salts=["NaCl", "KBr"])
+        for recipe, row in zip(recipes, ions):
+            assert list(row) == approx(list(salt2ions(recipe, volume=2, unit=unit).values())), "Test salt2ions_batch failed"
+    # 1 g/L of KNO3 (101.10 g/mol) brings 39.10/101.10 g/L of K+
+    assert salt2ions_batch(np.array([[1.0]]), salts=["KNO3"])[0][0] == approx(0.3867, abs=1e-4), "Test salt2ions_batch failed: g unit"
+
+#----------------------------- Test salt_catalog() ----------------------------
+def test_salt_catalog():
+    catalog = salt_catalog()
+    assert catalog.salts == list(dict_salts_trad), "Test salt_catalog failed: salts"
+    row = catalog.stoichiometry[catalog.salt_index["Ca(NO3)2"]]
+    assert row[catalog.column("Ca(2+)")] == 1 and row[catalog.column("NO3")] == 2 and row.sum() == 3, "Test salt_catalog failed: stoichiometry"
+    assert salt_catalog() is catalog, "Test salt_catalog failed: catalog not cached"
+    try:
+        new_catalog = register_salt("KTest", {"K+": 1, "Test-": 1})
+        assert new_catalog is not catalog and new_catalog.salts[-1] == "KTest", "Test register_salt failed"
+        assert salt2ions({"KTest": 0.1}, unit="mol") == {"K+": 0.1, "Test-": 0.1}, "Test register_salt failed: salt2ions"
+    finally:
+        dict_salts_trad.pop("KTest")
+        salt2nbIons.pop("KTest")
+    assert salt_catalog().salts == catalog.salts, "Test salt_catalog failed: catalog not rebuilt"
+
+#----------------------------- Test the ion registry ----------------------------
+def test_ion_registry():
+    assert ion_id("NH(4+)") == ion_id("NH4+") == ion_id("NH4"), "Test ion_id failed: aliases"
+    assert ion_id("Fe") == ion_id("Fe(3+)") != ion_id("Fe(2+)"), "Test ion_id failed: iron"
+    assert canonical_ion("NO3") == "NO3(-)" and ion_charge("SO4(2-)") == -2 and ion_charge("Cl-") == -1, "Test ion registry failed: charges"
+    assert ion_composition("NH(4+)") == {"N": 1, "H": 4}, "Test ion_composition failed"
+    assert ion_charge("Xy(3-)") == -3 and ion_id("Xy(3-)") == ion_id("Xy(3-)"), "Test ion registry failed: new species"
+    # The two ammonium salts share a column, and the pH module reads the names of the salts
+    assert salt2ions({"(NH4)6Mo7O24": 1, "(NH4)H2PO4": 1}, unit="mol")["NH4+"] == 7, "Test ion registry failed: salt2ions"
+    assert pH_approximation({"Ca(2+)": 0.01, "NO3(-)": 0.02, "HSO4(-)": 0.01}, 25) == pH_approximation({"Ca": 0.01, "NO3": 0.02, "HSO4": 0.01}, 25), "Test ion registry failed: pH"
+
 #----------------------------- Test make_solution() ----------------------------
 def test_make_solution():
     ions_in_solution = {"K+": 0.5, "Cl-": 0.6, "Br-": 0.1, "SO4(2-)": 0.5 }
@@ -69,6 +148,25 @@ def test_make_solution():
     volume = 10
     expected_result = {'KH2PO4': 15.6997161195170, 'MnCl2': 10.6491996897038, 'KBr': 1.48931592911494, 'MgSO4': 6.26514741400849}
     assert make_solution(ions_in_solution, forbidden_ions, volume) == approx(expected_result, 1e-3), "Test make_solution failed"
+
+def test_make_solution_numeric():
+    # 1 g KCl and 2 g K2SO4 in 1 L
+    ions_in_solution = {"K+": (1/get_molar_mass("KCl") + 4/get_molar_mass("K2SO4"))*get_molar_mass("K+"),
+                        "Cl-": get_molar_mass("Cl-")/get_molar_mass("KCl"),
+                        "SO4(2-)": 2*get_molar_mass("SO4(2-)")/get_molar_mass("K2SO4")}
+    expected_result = {"KCl": 1, "K2SO4": 2}
+    assert make_solution(ions_in_solution, [], 1, backend="numeric") == approx(expected_result, 1e-6), "Test make_solution numeric failed"
+    masses = make_solution({"K+": 0.5, "Cl-": 0.6, "Br-": 0.1, "SO4(2-)": 0.5 }, ['NO3(-)'], 10, backend="numeric")
+    assert all(mass > 0 for mass in masses.values()), "Test make_solution numeric failed: negative mass"
+
+def test_make_solution_numeric_traces():
+    # The trace nutrients are reached as closely as the macro nutrients
+    ions_in_solution = {ion: value for ion, value in predefined_solutions("Tomato").items() if ion not in ["NH4+", "Mo"]}
+    masses = make_solution(ions_in_solution, [], 1, backend="numeric")
+    assert all(type(salt) is str for salt in masses), "Test make_solution numeric failed: salt names"
+    moles = salt2ions({salt: mass/get_molar_mass(salt) for salt, mass in masses.items()}, unit="mol")
+    for ion, target in ions_in_solution.items():
+        assert moles[ion]*get_molar_mass(ion) == approx(target, rel=0.1), f"Test make_solution numeric failed: {ion}"
 #----------------------------- Test find_acid() ----------------------------
 
 def test_find_acid():
@@ -104,6 +202,22 @@ def test_find_acid():
     'NH4': [9.3]},{'PO4': 0, 'BO3': 0, 'HSO4': 0, 'NH4': 1})
     assert find_acid(Test_concentration_of_solution,pKa_values,highest_existing_charge_of_compounds) == expected_dict
 
+def test_speciation():
+    assert speciation("HPO4(2-)") == ("H3PO4", 2, [2.12, 7.21, 12.32], -2), "Test speciation failed"
+    assert speciation("NH3") == ("NH4", 1, [9.3], 0) and speciation("Ca(2+)") is None, "Test speciation failed"
+    try:
+        register_acid("H2CO3", [6.35, 10.33])
+        assert speciation("CO3(2-)") == ("H2CO3", 2, [6.35, 10.33], -2), "Test register_acid failed"
+        assert find_acid({"HCO3": 0}, pKa_values, highest_existing_charge_of_compounds)[0] == {"HCO3": 1}, "Test register_acid failed: find_acid"
+        # Other dictionaries are read on each call
+        assert find_acid({"HCO3": 0}, {"H3PO4": [2.12, 7.21, 12.32]}, {"H3PO4": 0})[0] == {}, "Test find_acid failed: other dictionaries"
+    finally:
+        pKa_values.pop("H2CO3")
+        highest_existing_charge_of_compounds.pop("H2CO3")
+        # The table is only built again by register_acid
+        PH_Approximation_0._SPECIATION_TABLE = None
+    assert speciation("CO3(2-)") is None, "Test register_acid failed: table not rebuilt"
+
 #----------------------------- Test pH_approximation() ----------------------------
 def test_pH_approximation():
     pKa_values={
@@ -129,16 +243,59 @@ def test_pH_approximation():
         "Cl" : float(0),
         "NH4" : float(0)}
     
+    # 0.02 mol/L of sulfuric acid
     result = pH_approximation(Test_concentration_of_solution,25)
-    lower_bound = 6
-    upper_bound = 7.5
-    assert lower_bound <= result <= upper_bound, f"Test failed: {result} is not within the range {lower_bound} to {upper_bound}"
+    assert result == approx(1.58, abs=0.01), f"Test failed: {result} is not close to 1.58"
+    assert pH_approximation(Test_concentration_of_solution,25) == result, "Test failed: pH_approximation is not deterministic"
+    assert pH_approximation({"K": 0.0}, 25) == approx(7), "Test failed: pure water should be neutral"
+
+def test_pH_approximation_batch():
+    species = ["H2SO4", "K", "PO4", "Cl"]
+    concentrations = [[0.02, 0, 0, 0], [0, 0.01, 0, 0], [0, 0.02, 0.01, 0.001]]
+    result = pH_approximation_batch(concentrations, species, 25)
+    for row, pH in zip(concentrations, result):
+        assert pH == approx(pH_approximation(dict(zip(species, row)), 25), abs=1e-8), "pH_approximation_batch: Test failed"
 
 #----------------------------- Test Refill_of_container() ----------------------------
 def test_Refill_of_container():
     concentration_of_ions = {"Na+": 0.1, "Cl-": 0.1, "K+": 0.05, "NO3(-)": 0.05}
     optimal_ion_concentrations = {"Na+": 0.2, "Cl-": 0.2, "K+": 0.1, "NO3(-)": 0.1}
     assert Refill_of_container(concentration_of_ions, optimal_ion_concentrations, 5) == {'Na+': 0.1, 'Cl-': 0.1, 'K+': 0.05, 'NO3(-)': 0.05}, "Refill_of_container: Test failed"
+    concentration_of_ions = {"Na+": 0.19, "Cl-": 0.1, "K+": 0.15, "NO3(-)": 0.05}
+    assert Refill_of_container(concentration_of_ions, optimal_ion_concentrations, 10) == approx({'Cl-': 0.1, 'NO3(-)': 0.05}), "Refill_of_container: Test tolerance failed"
+    assert Refill_of_container(concentration_of_ions, optimal_ion_concentrations, 1, 60, 1, 1) == approx({'Na+': 0.01, 'NO3(-)': 0.05}), "Refill_of_container: Test tolerance per ion failed"
+    assert Refill_of_container(concentration_of_ions, optimal_ion_concentrations)['K+'] == approx(-0.05), "Refill_of_container: Test without tolerance failed"
+
+def test_plan_refill():
+    # 1 g KCl and 2 g K2SO4 in 1 L
+    deficits = {"K+": (1/get_molar_mass("KCl") + 4/get_molar_mass("K2SO4"))*get_molar_mass("K+"),
+                "Cl-": get_molar_mass("Cl-")/get_molar_mass("KCl"),
+                "SO4(2-)": 2*get_molar_mass("SO4(2-)")/get_molar_mass("K2SO4"),
+                "Na+": -0.1}
+    assert plan_refill(deficits, ["NO3(-)"], 1) == approx({"KCl": 1, "K2SO4": 2}), "plan_refill: Test failed"
+    # Same salts: solved with the cached inverse
+    assert plan_refill(deficits, ["NO3(-)"], 3) == approx({"KCl": 3, "K2SO4": 6}), "plan_refill: Test cached plan failed"
+    # A micronutrient deficit is refilled as well as the macronutrients, also with the cached salts
+    deficits = {"NO3(-)": 0.5, "K+": 0.2, "Ca(2+)": 0.1, "Cu(2+)": 3e-5, "Zn(2+)": 2e-4}
+    for volume in [10, 20]:
+        salts = plan_refill(deficits, [], volume)
+        moles = salt2ions({salt: mass/get_molar_mass(salt) for salt, mass in salts.items()}, unit="mol")
+        for ion in ["Cu(2+)", "Zn(2+)"]:
+            assert moles[ion]*get_molar_mass(ion) == approx(deficits[ion]*volume, rel=0.01), f"plan_refill: Test {ion} failed"
+    assert plan_refill({"K+": 0.0}, [], 1) == {}, "plan_refill: Test no deficit failed"
+    try:
+        plan_refill({"K+": 0.1}, ["K+"], 1)
+        assert False, "plan_refill: forbidden ion accepted"
+    except ValueError:
+        pass
+
+def test_Concentration_Checker():
+    optimal = {f"reservoir {i}": {"K+": 0.1, "NO3(-)": 0.2} for i in range(200)}
+    sensor = SimulatedSensor(optimal, {"K+": 0.02, "NO3(-)": 0.001}, latency=0.001)
+    asyncio.run(Concentration_Checker(optimal, sensor.read, sensor.dose, 24*60*60*1000, 5, cycles=3))
+    assert len(sensor.commands) == 600, "Concentration_Checker: Test number of commands failed"
+    assert all(quantities == approx({"K+": 0.02}) for _, quantities in sensor.commands), "Concentration_Checker: Test tolerance failed"
+    assert all(ions == approx({"K+": 0.1, "NO3(-)": 0.197}) for ions in sensor.concentrations.values()), "Concentration_Checker: Test dosing failed"
 
 #----------------------------- Test generation_of_pH_list() ----------------------------
 def test_generation_of_pH_list():
@@ -173,5 +330,5 @@ def test_generation_of_pH_list():
       plant = "Eggplant"
       list_of_pH,exceeded_days_list=generation_of_pH_list(Test_concentrations_list_of_solution,temperature,plant)
       for i in range (len(list_of_pH)):
-          assert 6.0<=list_of_pH[i]<= 8.0, "generation_of_pH_list: Test failed"
-      assert type(exceeded_days_list) == list, "generation_of_pH_list: Test failed"
\ No newline at end of file
+          assert list_of_pH[i] == approx(1.58, abs=0.01), "generation_of_pH_list: Test failed"
+      assert exceeded_days_list == [0, 1], "generation_of_pH_list: Test failed"
\ No newline at end of file
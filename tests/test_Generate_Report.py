@@ -0,0 +1,37 @@
+"""This file contains tests for the functions in the Generate_Report.py file."""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+from hydroponics import *
+
+#----------------------------- Test generate_reports() ----------------------------
+def test_generate_reports(tmp_path):
+    spec = {"plant_name": "Eggplant", "required_nutriments": {"K+": 5, "Cl-": 6, "SO4(2-)": 3}, "growth_time": 20,
+            "ions_of_interest": ["K+", "Cl-"], "solution_composition": {"K+": 0.5, "Cl-": 0.6, "Br-": 0.1, "SO4(2-)": 0.5},
+            "solution_volume": 10, "forbidden_ions": ["NO3(-)"]}
+    specs = [dict(spec, name="first"), dict(spec), dict(spec, plant_name="Cucumber")]
+    paths = generate_reports(specs, str(tmp_path), processes=1, dpi=20)
+    assert paths == [os.path.join(str(tmp_path), name) for name in ["first.pdf", "report_1.pdf", "report_2.pdf"]], "generate_reports: Test paths failed"
+    assert all(os.path.getsize(path) > 0 for path in paths), "generate_reports: Test pdfs failed"
+    assert len(os.listdir(os.path.join(str(tmp_path), "figures"))) == 2, "generate_reports: identical reports were not shared"
+
+#----------------------------- Test generate_report() in memory ----------------------------
+def test_generate_report_in_memory(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    pdf = generate_report("Eggplant", {"K+": 5, "Cl-": 6}, 20, ["K+", "Cl-"], {"K+": 0.5, "Cl-": 0.6}, 10, dpi=20, output_path=None, verbose=False)
+    assert pdf.startswith(b"%PDF"), "generate_report: Test bytes failed"
+    assert capsys.readouterr().out == "", "generate_report: Test verbose failed"
+    assert os.listdir(str(tmp_path)) == [], "generate_report: files were written"
+    # Written to a path, only the pdf is written
+    generate_report("Eggplant", {"K+": 5, "Cl-": 6}, 20, ["K+", "Cl-"], {"K+": 0.5, "Cl-": 0.6}, 10, dpi=20, output_path="report.pdf")
+    assert os.listdir(str(tmp_path)) == ["report.pdf"], "generate_report: figures were written"
+    assert render_figure_bytes("pH_table", {"rows": [[1, 5.5]]}, dpi=20) is render_figure_bytes("pH_table", {"rows": [[1, 5.5]]}, dpi=20), "render_figure_bytes: Test cache failed"
+
+#----------------------------- Test the pH of a report ----------------------------
+def test_report_pH():
+    # The report solves the pH of the simulation, whose concentrations are in g/L
+    solution = predefined_solutions("Tomato")
+    plant = {ion: 8*value for ion, value in solution.items()}
+    pH_values, exceeded = generation_of_pH_list(simulate_growth(solution, 10, plant, 60), 25, "Eggplant")
+    assert all(5 < pH < 7 for pH in pH_values), "generate_report: Test pH failed"
@@ -0,0 +1,31 @@
+"""This file contains tests for the functions in the Instrumentation.py file."""
+
+import sys
+import os
+import subprocess
+src_dir = os.path.dirname(os.path.realpath(__file__)) + "/../src"
+sys.path.append(src_dir)
+import hydroponics
+
+def run_instrumented(code: str, enabled: str) -> str:
+    env = dict(os.environ, PYTHONPATH=src_dir, HYDROPONICS_INSTRUMENTATION=enabled)
+    return subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+
+#----------------------------- Test the instrumentation ----------------------------
+def test_instrumentation_enabled():
+    code = "import hydroponics\n"\
+        "hydroponics.check_solubility({'KNO3': 0.5})\n"\
+        "hydroponics.check_solubility({'KNO3': 0.1})\n"\
+        "hydroponics.get_molar_mass('KNO3')\n"\
+        "snapshot = hydroponics.instrumentation_snapshot()\n"\
+        "print(snapshot['timers']['Solutions_Solubility.check_solubility']['calls'], snapshot['caches']['get_molar_mass']['hits'] > 0)\n"\
+        "print(hydroponics.prometheus_text())"
+    output = run_instrumented(code, "1")
+    assert output.startswith("2 True"), "Instrumentation: Test timers failed"
+    assert 'hydroponics_function_calls_total{function="Solutions_Solubility.check_solubility"} 2' in output, "Instrumentation: Test prometheus failed"
+
+def test_instrumentation_disabled():
+    code = "import hydroponics\n"\
+        "hydroponics.check_solubility({'KNO3': 0.5})\n"\
+        "print(hasattr(hydroponics.check_solubility, '__wrapped__'), hydroponics.instrumentation_snapshot()['timers'])"
+    assert run_instrumented(code, "0").strip() == "False {}", "Instrumentation: disabled instrumentation is not free"
@@ -3,6 +3,8 @@
 # Importing functions from Basic_functions.py file and Solutions_Solubility.py file
 import sys
 import os
+from pytest import approx
+import numpy as np
 sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
 from hydroponics.Basic_functions import *
 from hydroponics.Solutions_Solubility import *
@@ -33,7 +35,8 @@ def test_insoluble_solution_salt_input_bool_output():
 def test_insoluble_solution_salt_input_analysis_output():
     # Test with insoluble salts
     solution = {"MnCl2" : 0.0223, "KNO3" : 493, "Ca(NO3)2" : 0.945}
-    output = "The following salts precipitate: Ca(NO3)2    KNO3    "
+    # 493 g/L of KNO3 is above its solubility, 0.945 g/L of Ca(NO3)2 is not
+    output = "The following salts precipitate: KNO3    "
     assert check_solubility(solution, input_type="salt", output_type="analysis") == output,"check_solubility: Test insoluble_solution_salt_input_analysis_output failed"
 
 def test_invalid_input_type():
@@ -51,6 +54,20 @@ def test_invalid_output_type():
         check_solubility(solution, input_type="salt", output_type="invalid")
     except ValueError as e:
         assert str(e) == "Invalid output type. Please choose either 'bool', 'analysis', or 'update'.", "check_solubility: Test invalid_output_type failed"
+
+def test_check_solubility_batch():
+    # One soluble and one insoluble solution, [mol/L]
+    ions = ["K+", "NO3(-)", "Ca(2+)"]
+    concentrations = [[0.005, 0.01, 0.002], [5, 5, 0]]
+    precipitation = check_solubility_batch(concentrations, ions)
+    salts = list(dict_salts_trad)
+    assert precipitation.shape == (2, len(salts)), "check_solubility_batch: Test shape failed"
+    assert not precipitation[0].any(), "check_solubility_batch: Test soluble row failed"
+    assert [salts[j] for j in precipitation[1].nonzero()[0]] == ["KNO3"], "check_solubility_batch: Test insoluble row failed"
+    # Two names of the carbonate are added up, not counted twice
+    calcium = np.logspace(-6, 0, 25)
+    aliased = check_solubility_batch(np.column_stack([calcium, calcium/2, calcium/2]), ["Ca(2+)", "CO3", "CO3(2-)"])
+    assert (aliased == check_solubility_batch(np.column_stack([calcium, calcium]), ["Ca(2+)", "CO3(2-)"])).all(), "check_solubility_batch: Test aliases failed"
         
         
         
@@ -67,7 +84,8 @@ def test_ion_input():
 
 def test_salt_input():
     solution = {"NaCl":0.1, "KNO3": 0.05}
-    plant = {"Na+": 0.6, "Cl-": 0.9, "K+": 0.8, "NO3(-)": 0.7}
+    # 2 L of the solution bring 0.079 g of Na+, 0.121 g of Cl-, 0.039 g of K+ and 0.061 g of NO3(-)
+    plant = {"Na+": 0.06, "Cl-": 0.09, "K+": 0.03, "NO3(-)": 0.05}
     growth_time = 100
     volume = 2
     expected_output = [True, 100, None]
@@ -110,3 +128,95 @@ def test_update_sol_basic():
 
         
     
+
+
+#-----------------Test data4graph() and simulate_growth() functions--------------------------------
+def test_data4graph():
+    solution = {"K+": 1.0, "NO3(-)": 2.0, "Ca(2+)": 0.5}
+    plant = {"K+": 3.0, "NO3(-)": 2.0}
+    data = data4graph(solution, 2, plant, 10)
+    assert data[0] == list(range(11)), "data4graph: Test days failed"
+    # 0.15 g/L of K+ and 0.1 g/L of NO3- are used each day until K+ no longer covers the daily need
+    assert data[1][1] == approx({"K+": 0.85, "NO3(-)": 1.9, "Ca(2+)": 0.5}), "data4graph: Test day 1 failed"
+    assert data[1][4] == approx({"K+": 0.4, "NO3(-)": 1.6, "Ca(2+)": 0.5}), "data4graph: Test day 4 failed"
+    assert data[1][10] == data[1][5], "data4graph: Test growth stop failed"
+    assert solution == {"K+": 1.0, "NO3(-)": 2.0, "Ca(2+)": 0.5}, "data4graph: the input solution was modified"
+
+def test_simulate_growth_precipitates():
+    solution = {"K+": 300.0, "NO3(-)": 500.0}
+    plant = {"K+": 2000.0, "NO3(-)": 3000.0}
+    simulation = simulate_growth(solution, 1, plant, 10)
+    KNO3 = simulation["salts"].index("KNO3")
+    assert simulation["concentrations"].shape == (11, 2), "simulate_growth: Test shape failed"
+    assert simulation["precipitates"][0, KNO3], "simulate_growth: KNO3 should precipitate at day 0"
+    assert not simulation["precipitates"][-1, KNO3], "simulate_growth: KNO3 should be dissolved at the end"
+
+def test_simulate_growth_time_step():
+    solution = {"K+": 1.0, "NO3(-)": 2.0, "Ca(2+)": 0.5}
+    plant = {"K+": 3.0, "NO3(-)": 2.0}
+    daily = simulate_growth(solution, 2, plant, 10)
+    hourly = simulate_growth(solution, 2, plant, 10, dt=1/24)
+    assert hourly["concentrations"].shape == (241, 3), "simulate_growth: Test hourly shape failed"
+    assert hourly["concentrations"][24] == approx(daily["concentrations"][1]), "simulate_growth: Test hourly day 1 failed"
+    downsampled = simulate_growth(solution, 2, plant, 10, dt=1/24, every=24)
+    assert downsampled["days"] == approx(daily["days"]), "simulate_growth: Test downsampling failed"
+    last = simulate_growth(solution, 2, plant, 10, dt=1/24, keep_last=5)
+    assert last["concentrations"] == approx(hourly["concentrations"][-5:]), "simulate_growth: Test ring buffer failed"
+    assert sum(1 for _ in iter_growth(solution, 2, plant, 10, dt=0.5)) == 21, "iter_growth: Test number of steps failed"
+    # 10 is not a multiple of 0.3: the last step is shortened and the plant takes up all its need
+    uneven = simulate_growth({"K+": 10.0, "NO3(-)": 20.0}, 2, plant, 10, dt=0.3)
+    assert len(uneven["days"]) == 35 and uneven["days"][-1] == 10, "simulate_growth: Test uneven time step failed"
+    assert uneven["concentrations"][-1] == approx([10 - 3/2, 20 - 2/2]), "simulate_growth: Test uneven uptake failed"
+
+def test_simulate_growth_events():
+    solution = {"K+": 300.0, "NO3(-)": 500.0, "Ca(2+)": 50.0}
+    plant = {"K+": 2000.0, "NO3(-)": 3000.0}
+    events = simulate_growth_events(solution, 1, plant, 10)
+    simulation = simulate_growth(solution, 1, plant, 10)
+    evaluated = evaluate_growth_events(events, np.arange(11))
+    assert evaluated["concentrations"] == approx(simulation["concentrations"]), "simulate_growth_events: Test concentrations failed"
+    assert (evaluated["precipitates"] == simulation["precipitates"]).all(), "simulate_growth_events: Test precipitates failed"
+    KNO3 = events["salts"].index("KNO3")
+    assert 0 < events["dissolution_times"][KNO3] < events["stop_time"], "simulate_growth_events: Test dissolution time failed"
+    assert (events["dissolution_times"][KNO3], "dissolved", "KNO3") in events["events"], "simulate_growth_events: Test events failed"
+    hourly = evaluate_growth_events(events, np.arange(0, 10, 1/24))
+    assert hourly["concentrations"].shape == (240, 3), "simulate_growth_events: Test hourly shape failed"
+
+#-----------------Test sweep_nutriments() function--------------------------------
+def test_sweep_nutriments():
+    solutions = {"A": {"NaCl": 0.1, "KNO3": 0.05}, "B": {"NaCl": 0.01, "KNO3": 0.05}}
+    plants = {"small": {"Na+": 0.6, "Cl-": 0.9, "K+": 0.8, "NO3(-)": 0.7}}
+    volumes = [1, 2]
+    growth_times = [50, 100]
+    rows = list(iter_sweep_nutriments(solutions, plants, volumes, growth_times, processes=2, chunksize=3))
+    assert len(rows) == 8, "sweep_nutriments: Test number of rows failed"
+    for row in rows:
+        expected = analyse_nutriments(solutions[row["solution"]], plants[row["plant"]], row["growth_time"], row["volume"])
+        assert [row["enough"], row["growth_limit"], row["limiting_ion"]] == expected, "sweep_nutriments: Test values failed"
+    table = sweep_nutriments(solutions, plants, volumes, growth_times, processes=2)
+    assert table.equals(sweep_nutriments(solutions, plants, volumes, growth_times, processes=1)), "sweep_nutriments: Test single process failed"
+
+#-----------------Test plot_graph() function--------------------------------
+def test_plot_graph(tmp_path):
+    solution = {"K+": 1.0, "NO3(-)": 2.0}
+    plant = {"K+": 3.0, "NO3(-)": 2.0}
+    path = plot_graph(solution, "ion", plant, 10, 2, ["K+"], output_dir=str(tmp_path), dpi=50, format="svg")
+    assert path == os.path.join(str(tmp_path), "graph_K+_.svg"), "plot_graph: Test path failed"
+    os.utime(path, (0, 0))
+    plot_graph(solution, "ion", plant, 10, 2, ["K+"], output_dir=str(tmp_path), dpi=50, format="svg")
+    assert os.path.getmtime(path) == 0, "plot_graph: unchanged graph was rendered again"
+    plot_graph(solution, "ion", plant, 10, 3, ["K+"], output_dir=str(tmp_path), dpi=50, format="svg")
+    assert os.path.getmtime(path) != 0, "plot_graph: changed graph was not rendered again"
+
+def test_simulation_result_is_shared(tmp_path):
+    solution = {"K+": 1.0, "NO3(-)": 2.0}
+    plant = {"K+": 3.0, "NO3(-)": 2.0}
+    simulation = simulate_growth(solution, 2, plant, 10)
+    assert simulation["analysis"] == analyse_nutriments(solution, plant, 10, 2, "ion"), "simulate_growth: Test analysis failed"
+    path = plot_graph(None, "ion", None, None, ions_of_interest=["K+"], output_dir=str(tmp_path), dpi=50, simulation=simulation)
+    assert path == plot_graph(solution, "ion", plant, 10, 2, ["K+"], output_dir=str(tmp_path), dpi=50), "plot_graph: Test simulation failed"
+    from hydroponics.pH_graph_0 import generation_of_pH_list
+    # The simulation is in g/L, generation_of_pH_list converts it to mol/L
+    molar_days = [{ion: value/get_molar_mass(ion) for ion, value in day.items()} for day in data4graph(solution, 2, plant, 10)[1]]
+    pH_values, exceeded = generation_of_pH_list(simulation, 25, "Eggplant")
+    assert pH_values == approx(generation_of_pH_list(molar_days, 25, "Eggplant")[0]), "generation_of_pH_list: Test simulation failed"
@@ -0,0 +1,31 @@
+"""This file contains tests for the lazy imports of the hydroponics package."""
+
+import sys
+import os
+import subprocess
+src_dir = os.path.dirname(os.path.realpath(__file__)) + "/../src"
+sys.path.append(src_dir)
+import hydroponics
+
+HEAVY_MODULES = ["pandas", "sympy", "matplotlib", "reportlab"]
+
+def run_in_fresh_interpreter(code: str) -> str:
+    env = dict(os.environ, PYTHONPATH=src_dir)
+    return subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+
+#----------------------------- Test lazy imports ----------------------------
+def test_import_does_not_load_heavy_dependencies():
+    code = "import sys, hydroponics\n"\
+        "hydroponics.get_molar_mass('Ca(NO3)2')\n"\
+        f"print([name for name in {HEAVY_MODULES} if name in sys.modules])"
+    assert run_in_fresh_interpreter(code).strip() == "[]", "Lazy imports: heavy dependencies were imported"
+
+def test_all_names_are_available():
+    for name in hydroponics.__all__:
+        assert getattr(hydroponics, name) is not None, f"Lazy imports: {name} is not available"
+    assert hydroponics.Basic_functions.get_molar_mass is hydroponics.get_molar_mass, "Lazy imports: submodule access failed"
+    try:
+        hydroponics.not_a_function
+        assert False, "Lazy imports: unknown name did not raise"
+    except AttributeError:
+        pass